@@ -1,46 +1,67 @@
+import asyncio
 import logging
 import configparser
 import os
+import signal
 import sys
-from renogybt import DCChargerClient, InverterClient, RoverClient, RoverHistoryClient, BatteryClient, ShuntClient, DataLogger, Utils
+from renogybt import FleetRunner, DataLogger, Replay
+from renogybt.Capture import RECORDER
+from renogybt.Metrics import REGISTRY
+from renogybt.Settings import Settings, load_settings
+from renogybt.Tracer import TRACER
 
 logging.basicConfig(level=logging.INFO)
 
 config_file = sys.argv[1] if len(sys.argv) > 1 else 'config.ini'
 config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), config_file)
-config = configparser.ConfigParser(inline_comment_prefixes=('#'))
-config.read(config_path)
-data_logger: DataLogger = DataLogger(config)
+
+def read_config():
+    config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    config.read(config_path)
+    return config
+
+config = read_config()
+settings = Settings(config) # parsed once, replaced on SIGHUP
+data_logger: DataLogger = DataLogger(config) # applies change_only to the mqtt and remote logging sinks
 
 # the callback func when you receive data
+# client.config holds the [device] section of the device that produced the data
 def on_data_received(client, data):
-    filtered_data = Utils.filter_fields(data, config['data']['fields'])
+    filtered_data = settings.project(data)
     logging.info(f"{client.ble_manager.device.name} => {filtered_data}")
-    if config['remote_logging'].getboolean('enabled'):
-        data_logger.log_remote(json_data=filtered_data)
-    if config['mqtt'].getboolean('enabled'):
-        data_logger.log_mqtt(json_data=filtered_data)
-    if config['pvoutput'].getboolean('enabled') and config['device']['type'] == 'RNG_CTRL':
-        data_logger.log_pvoutput(json_data=filtered_data)
-    if not config['data'].getboolean('enable_polling'):
+    data_logger.submit(client, filtered_data) # queued, delivered in the background
+    if not settings.enable_polling:
         client.stop()
 
 # error callback
 def on_error(client, error):
     logging.error(f"on_error: {error}")
 
-# start client
-if config['device']['type'] == 'RNG_CTRL':
-    RoverClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_CTRL_HIST':
-    RoverHistoryClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_BATT':
-    BatteryClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_INVT':
-    InverterClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_DCC':
-    DCChargerClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_SHNT':
-    ShuntClient(config, on_data_received, on_error).start()
-else:
-    logging.error("unknown device type")
+# kill -HUP <pid> applies [data] and logging changes without reconnecting the devices
+def on_reload():
+    global settings
+    new_settings = load_settings(read_config())
+    if new_settings is None: return # keep running with the current settings
+    settings = new_settings
+    fleet.reload(settings)
+    data_logger.reload(settings)
+
+# optional prometheus endpoint, see [metrics]
+if config.getboolean('metrics', 'enabled', fallback=False):
+    REGISTRY.serve(config['metrics'].getint('port', fallback=9105))
+if config.get('debug', 'trace', fallback=''):
+    TRACER.open(config['debug']['trace'])
+if config.get('debug', 'capture', fallback=''):
+    RECORDER.open(config['debug']['capture'])
+
+# start clients, one per [device] / [device.<name>] section
+fleet = FleetRunner(config, on_data_received, on_error)
+if config.get('debug', 'replay', fallback=''):
+    replay = Replay(config['debug']['replay'], config['debug'].getfloat('replay_speed', fallback=1))
+    for client in fleet.clients: replay.attach(client)
+if hasattr(signal, 'SIGHUP'): # not on Windows
+    asyncio.get_event_loop().add_signal_handler(signal.SIGHUP, on_reload)
+fleet.start()
+asyncio.get_event_loop().run_until_complete(data_logger.close()) # flush pending uploads
+TRACER.close()
+RECORDER.close()
@@ -1,12 +1,90 @@
 import asyncio
 import logging
 import sys
+import time
 from bleak import BleakClient, BleakScanner, BLEDevice
+from .Capture import CONNECTED, DISCONNECTED, LOST, NOTIFY, RECORDER, WRITE
+from .Metrics import CONNECT_FAILURES, CONNECT_SECONDS, DISCONNECTS, DISCOVERY_SECONDS
+from .Tracer import TRACER
 
 DISCOVERY_TIMEOUT = 5 # max wait time to complete the bluetooth scanning (seconds)
+SCAN_CACHE_TTL = 30 # how long a seen advertisement can be reused without scanning again (seconds)
+SCAN_POLL_INTERVAL = 0.1 # (seconds)
+
+# Process-wide cache of scan results shared by all BLEManager instances of an adapter.
+# Discoveries running at the same time share one BleakScanner, and each of them
+# returns as soon as its own device is seen instead of waiting for the full timeout.
+class ScanCache:
+    def __init__(self, adapter=None):
+        self.adapter = adapter
+        self.devices = {} # address => (BLEDevice, monotonic time last seen)
+        self.waiters = []
+        self.scanning = False
+
+    def add(self, device: BLEDevice):
+        if device.address is None: return
+        self.devices[device.address.upper()] = (device, time.monotonic())
+        for matcher, future in self.waiters:
+            if not future.done() and matcher(device):
+                future.set_result(device)
+
+    def find(self, matcher, ttl):
+        for device in self.recent(ttl):
+            if matcher(device): return device
+        return None
+
+    def recent(self, ttl):
+        now = time.monotonic()
+        return [device for device, seen_at in self.devices.values() if now - seen_at <= ttl]
+
+    def evict(self, address):
+        if address: self.devices.pop(address.upper(), None)
+
+    async def wait_for(self, matcher, timeout):
+        loop = asyncio.get_running_loop()
+        waiter = (matcher, loop.create_future())
+        self.waiters.append(waiter)
+        if not self.scanning:
+            self.scanning = True
+            loop.create_task(self.__scan())
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if waiter in self.waiters: self.waiters.remove(waiter)
+
+    # keeps scanning for as long as somebody is waiting for a device. Discoveries arriving
+    # while the scanner stops wait in a fresh list and get a new scan once it has stopped.
+    async def __scan(self):
+        waiters = self.waiters # the discoveries this scan serves
+        try:
+            kwargs = {'bluez': {'adapter': self.adapter}} if self.adapter else {}
+            async with BleakScanner(detection_callback=lambda device, adv: self.add(device), **kwargs):
+                while waiters:
+                    await asyncio.sleep(SCAN_POLL_INTERVAL)
+                self.waiters = []
+        except Exception as e:
+            logging.error(f"Scanning failed: {e}")
+        finally:
+            if self.waiters is waiters: self.waiters = []
+            for _, future in waiters:
+                if not future.done(): future.set_result(None)
+            self.scanning = len(self.waiters) > 0
+            if self.scanning:
+                asyncio.get_running_loop().create_task(self.__scan())
+
+SCAN_CACHE = ScanCache() # default adapter
+SCAN_CACHES = {} # adapter name => ScanCache
+
+def scan_cache(adapter=None):
+    if not adapter: return SCAN_CACHE
+    if adapter not in SCAN_CACHES:
+        SCAN_CACHES[adapter] = ScanCache(adapter)
+    return SCAN_CACHES[adapter]
 
 class BLEManager:
-    def __init__(self, mac_address, alias, on_data, on_connect_fail, on_disconnect, write_service_uuid, notify_char_uuid, write_char_uuid):
+    def __init__(self, mac_address, alias, on_data, on_connect_fail, on_disconnect, write_service_uuid, notify_char_uuid, write_char_uuid, scan_cache_ttl=SCAN_CACHE_TTL, adapter=None):
         self.mac_address = mac_address
         self.device_alias = alias
         self.data_callback = on_data
@@ -19,29 +97,47 @@ class BLEManager:
         self.device: BLEDevice = None
         self.client: BleakClient = None
         self.discovered_devices = []
+        self.scan_cache_ttl = scan_cache_ttl
+        self.adapter = adapter # e.g. hci1, None for the system default
         self._intentional_disconnect = False
 
+    def matches(self, dev: BLEDevice):
+        return dev.address != None and (dev.address.upper() == self.mac_address.upper() or (dev.name and dev.name.strip() == self.device_alias))
+
     async def discover(self):
-        mac_address = self.mac_address.upper()
+        cache = scan_cache(self.adapter)
+        self.device = cache.find(self.matches, self.scan_cache_ttl)
+        if self.device:
+            logging.info(f"Found matching device in scan cache {self.device.name} => {self.device.address}")
+            DISCOVERY_SECONDS.observe(0, device=self.device_alias, result='cache')
+            TRACER.instant('discover', self.device_alias, result='cache')
+            return
+
         logging.info("Starting discovery...")
-        self.discovered_devices = await BleakScanner.discover(timeout=DISCOVERY_TIMEOUT)
+        started = time.monotonic()
+        self.device = await cache.wait_for(self.matches, DISCOVERY_TIMEOUT)
+        result = 'found' if self.device else 'not_found'
+        DISCOVERY_SECONDS.observe(time.monotonic() - started, device=self.device_alias, result=result)
+        TRACER.complete('discover', self.device_alias, started, time.monotonic(), result=result)
+        self.discovered_devices = cache.recent(DISCOVERY_TIMEOUT)
         logging.info("Devices found: %s", len(self.discovered_devices))
-
-        for dev in self.discovered_devices:
-            if dev.address != None and (dev.address.upper() == mac_address or (dev.name and dev.name.strip() == self.device_alias)):
-                logging.info(f"Found matching device {dev.name} => {dev.address}")
-                self.device = dev
+        if self.device:
+            logging.info(f"Found matching device {self.device.name} => {self.device.address}")
 
     async def connect(self):
         if not self.device: return logging.error("No device connected!")
 
         self._intentional_disconnect = False
-        self.client = BleakClient(self.device, disconnected_callback=self._on_disconnected)
+        kwargs = {'bluez': {'adapter': self.adapter}} if self.adapter else {}
+        self.client = BleakClient(self.device, disconnected_callback=self._on_disconnected, **kwargs)
+        started = time.monotonic()
         try:
             await self.client.connect()
+            TRACER.complete('connect', self.device_alias, started, time.monotonic())
             logging.info(f"Client connection: {self.client.is_connected}")
             if not self.client.is_connected: return logging.error("Unable to connect")
 
+            enumerating = time.monotonic()
             for service in self.client.services:
                 for characteristic in service.characteristics:
                     if characteristic.uuid == self.notify_char_uuid:
@@ -50,9 +146,14 @@ class BLEManager:
                     if characteristic.uuid == self.write_char_uuid and service.uuid == self.write_service_uuid:
                         self.write_char_handle = characteristic.handle
                         logging.info(f"found write characteristic {characteristic.uuid}, service {service.uuid}")
+            TRACER.complete('services', self.device_alias, enumerating, time.monotonic())
+            CONNECT_SECONDS.observe(time.monotonic() - started, device=self.device_alias)
+            RECORDER.record(CONNECTED, self.device_alias, mac_addr=self.device.address)
 
         except Exception:
-            logging.error(f"Error connecting to device")
+            logging.error("Error connecting to device")
+            CONNECT_FAILURES.inc(device=self.device_alias)
+            scan_cache(self.adapter).evict(self.device.address) # force a fresh scan on retry
             self.connect_fail_callback(sys.exc_info())
 
     def _on_disconnected(self, client):
@@ -60,19 +161,24 @@ class BLEManager:
             logging.info("Disconnected intentionally.")
         else:
             logging.warning(f"Unexpected disconnect from device: {client.address}")
+            DISCONNECTS.inc(device=self.device_alias)
+            RECORDER.record(LOST, self.device_alias, mac_addr=self.device.address)
             if self.disconnect_callback:
                 self.disconnect_callback()
 
     async def notification_callback(self, characteristic, data: bytearray):
         logging.info("notification_callback")
+        TRACER.instant('notification', self.device_alias, bytes=len(data))
+        RECORDER.record(NOTIFY, self.device_alias, data, self.device.address)
         await self.data_callback(data)
 
     async def characteristic_write_value(self, data):
         try:
             logging.info(f'writing to {self.write_char_uuid} {data}')
-            await self.client.write_gatt_char(self.write_char_handle, bytearray(data), response=False)
+            RECORDER.record(WRITE, self.device_alias, data, self.device.address)
+            with TRACER.span('write', self.device_alias, bytes=len(data)):
+                await self.client.write_gatt_char(self.write_char_handle, bytearray(data), response=False)
             logging.info('characteristic_write_value succeeded')
-            await asyncio.sleep(0.5)
         except Exception as e:
             logging.info(f'characteristic_write_value failed {e}')
 
@@ -81,4 +187,5 @@ class BLEManager:
             self._intentional_disconnect = True
             if self.client.is_connected:
                 logging.info(f"Exit: Disconnecting device: {self.device.name} {self.device.address}")
+                RECORDER.record(DISCONNECTED, self.device_alias, mac_addr=self.device.address)
                 await self.client.disconnect()
@@ -1,13 +1,24 @@
 import asyncio
 import configparser
 import logging
+import time
 import traceback
-from .BLEManager import BLEManager
+from collections import namedtuple
+from .BLEManager import BLEManager, SCAN_CACHE_TTL
+from .FrameAssembler import FrameAssembler
+from .Metrics import READ_FAILURES, READ_TIMEOUTS, READINGS, REQUEST_SECONDS, RETRIES
+from .Settings import Settings
+from .Tracer import TRACER
 from .Utils import bytes_to_int, crc16_modbus, int_to_bytes
 
 # Base class that works with all Renogy family devices
 # Should be extended by each client with its own parsers and section definitions
 # Section example: {'register': 5000, 'words': 8, 'parser': self.parser_func}
+# Parsers typically decode a RegisterMap with self.decode_section(REGISTER_MAP, bs)
+# Consecutive sections are merged into fewer read requests, see plan_reads()
+# Sections may carry a 'refresh' policy, e.g. 'refresh': ONCE_PER_CONNECTION for the model
+# or Refresh(seconds=300). They are only read when due, their last values are folded into
+# every reading in between. Sections without one are read every cycle.
 
 ALIAS_PREFIXES = ['BT-TH', 'RNGRBP', 'BTRIC', 'RTMShunt', 'RNGRIU']
 WRITE_SERVICE_UUID = "0000ffd0-0000-1000-8000-00805f9b34fb"
@@ -16,26 +27,61 @@ WRITE_CHAR_UUID  = "0000ffd1-0000-1000-8000-00805f9b34fb"
 READ_TIMEOUT = 15 # (seconds)
 READ_SUCCESS = 3
 READ_ERROR = 131
+MAX_READ_WORDS = 64 # max words in a single read request
+MIN_ADAPTIVE_GAP = 0.05 # first step of the adaptive inter-request gap (seconds)
+MAX_ADAPTIVE_GAP = 1.0 # upper bound of the adaptive inter-request gap (seconds)
+MAX_PIPELINE_WINDOW = 4 # max read requests in flight, clients lower it for devices that can't keep up
+ONCE_PER_CONNECTION = 'connection'
+AUTO_ADAPTER = 'auto' # adapter picked by FleetRunner
+Refresh = namedtuple('Refresh', ['cycles', 'seconds'], defaults=[None, None]) # read every n cycles or seconds
 
 class BaseClient:
+    max_pipeline_window = MAX_PIPELINE_WINDOW
+
     def __init__(self, config):
         self.config: configparser.ConfigParser = config
+        self.settings = Settings(config)
+        self.alias = self.config['device']['alias'] # read once, used for every metric, trace and reading
         self.ble_manager = None
+        self.ble_manager_class = None # BLEManager unless replaced, e.g. by the Simulator
+        self.parent = None # HubClient owning the connection when this client is one of its slaves
         self.device = None
         self.poll_timer = None
         self.read_timeout = None
         self.data = {}
         self.device_id = self.config['device'].getint('device_id')
         self.sections = []
+        self.read_plan = []
         self.section_index = 0
+        self.frame_assembler = FrameAssembler()
+        self.decoders = {}
+        self.read_gap = self.config['device'].getint('read_gap', fallback=0)
+        self.max_read_words = self.config['device'].getint('max_read_words', fallback=MAX_READ_WORDS)
+        self.min_request_gap = self.config['device'].getfloat('request_gap', fallback=0)
+        self.request_gap = self.min_request_gap
+        self.adaptive_gap = self.config['device'].getboolean('adaptive_gap', fallback=False)
+        self.pipeline_window = max(1, min(self.config['device'].getint('pipeline_window', fallback=1), self.max_pipeline_window))
+        self.in_flight = [] # pipelined requests awaiting a response
+        self.next_index = 0 # next read plan entry to send when pipelined
+        self.request_sent = None # monotonic time the pending stop-and-wait request was written
+        self.cycle_started = None # monotonic time the current read cycle started
+        self.section_refresh = self.config['device'].getboolean('section_refresh', fallback=True)
+        self.cycle = 0
+        self.connections = 0
+        self.section_reads = {} # section key => (cycle, monotonic time, connection) of the last successful read
+        self.section_cache = {} # section key => fields parsed from it
+        self.adapter = self.config['device'].get('adapter', fallback='').strip() or None # e.g. hci1, auto is resolved by FleetRunner
+        if self.adapter == AUTO_ADAPTER: self.adapter = None
+        self.connection_slot = None # asyncio.Semaphore limiting concurrent scans/connects on the adapter, see FleetRunner
         self.loop = None
+        self.future = None
         self.write_service_uuid = getattr(self, 'write_service_uuid', WRITE_SERVICE_UUID)
         self.write_char_uuid = getattr(self, 'write_char_uuid', WRITE_CHAR_UUID)
         self.notify_char_uuid = getattr(self, 'notify_char_uuid', NOTIFY_CHAR_UUID)
         self._retry_count = 0
         self._reconnecting = False
         self.max_retry = self.config['device'].getint('max_retry', fallback=3)
-        logging.info(f"Init {self.__class__.__name__}: {self.config['device']['alias']} => {self.config['device']['mac_addr']}")
+        logging.info(f"Init {self.__class__.__name__}: {self.alias} => {self.config['device']['mac_addr']}")
 
     def start(self):
         try:
@@ -49,79 +95,226 @@ class BaseClient:
             self.loop = None
             self.__on_error("KeyboardInterrupt")
 
+    # Coroutine counterpart of start() for callers that own the event loop,
+    # e.g. FleetRunner running many clients side by side on one loop
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.loop.create_task(self.connect())
+        await self.future
+
     async def connect(self):
-        self.ble_manager = BLEManager(
+        await self.__acquire_slot()
+        try:
+            connected = await self.__discover_and_connect()
+        finally:
+            self.__release_slot() # only held while scanning and connecting, the link stays up without it
+        if connected:
+            self._retry_count = 0
+            self.connections += 1
+            await self.read_section()
+
+    async def __discover_and_connect(self):
+        self.ble_manager = (self.ble_manager_class or BLEManager)(
             mac_address=self.config['device']['mac_addr'],
-            alias=self.config['device']['alias'],
+            alias=self.alias,
             on_data=self.on_data_received,
             on_connect_fail=self.__on_connect_fail,
             on_disconnect=self.__on_disconnect,
             notify_char_uuid=self.notify_char_uuid,
             write_char_uuid=self.write_char_uuid,
             write_service_uuid=self.write_service_uuid,
+            scan_cache_ttl=self.config['device'].getint('scan_cache_ttl', fallback=SCAN_CACHE_TTL),
+            adapter=self.adapter,
         )
         await self.ble_manager.discover()
 
         if not self.ble_manager.device:
-            logging.error(f"Device not found: {self.config['device']['alias']} => {self.config['device']['mac_addr']}, please check the details provided.")
+            logging.error(f"Device not found: {self.alias} => {self.config['device']['mac_addr']}, please check the details provided.")
             for dev in self.ble_manager.discovered_devices:
                 if dev.name != None and dev.name.startswith(tuple(ALIAS_PREFIXES)):
                     logging.info(f"Possible device found! ====> {dev.name} > [{dev.address}]")
             if self.loop and self.loop.is_running():
                 self.loop.create_task(self.__handle_retry_async("Device not found during discovery"))
-            return
-        else:
-            await self.ble_manager.connect()
-            if self.ble_manager.client and self.ble_manager.client.is_connected:
-                self._retry_count = 0
-                await self.read_section()
+            return False
+        await self.ble_manager.connect()
+        return bool(self.ble_manager.client and self.ble_manager.client.is_connected)
 
     async def disconnect(self):
         if self.ble_manager:
             await self.ble_manager.disconnect()
-        self.future.set_result('DONE')
+        if self.future and not self.future.done():
+            self.future.set_result('DONE')
 
-    async def on_data_received(self, response):
-        if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+    # Notifications are reassembled into whole, CRC checked frames before being handled.
+    # A frame dropped for a bad CRC fails the pipelined request it matches by length.
+    async def on_data_received(self, data):
+        frames = self.frame_assembler.feed(data)
+        rejected = self.frame_assembler.rejected
+        for frame in frames:
+            await self.on_frame_received(frame)
+
+        if len(rejected) > 0:
+            logging.info("on_data_received: read operation failed with bad crc")
+            if self.pipeline_window > 1:
+                failed = 0
+                for frame in rejected:
+                    request = self.__match_request(frame)
+                    if request is None:
+                        logging.warning(f"on_data_received: bad crc response matches no pending request: {frame.hex()}")
+                        continue
+                    self.__complete_request(request, None)
+                    failed += 1
+                if failed > 0: await self.__advance_pipeline()
+                return
+            if len(frames) > 0: return # the response to the pending request got through
+            if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+            READ_FAILURES.inc(device=self.alias, reason='crc')
+            self.__adapt_request_gap(False)
+            await self.__read_next()
+
+    async def on_frame_received(self, response):
         operation = bytes_to_int(response, 1, 1)
+        if self.pipeline_window > 1 and operation in (READ_SUCCESS, READ_ERROR):
+            request = self.__match_request(response)
+            if request is None:
+                return logging.warning(f"on_data_received: response matches no pending request: {response.hex()}")
+            self.__complete_request(request, response)
+            return await self.__advance_pipeline()
+
+        if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
 
         if operation == READ_SUCCESS or operation == READ_ERROR:
-            if (operation == READ_SUCCESS and
-                self.section_index < len(self.sections) and
-                self.sections[self.section_index]['parser'] != None and
-                self.sections[self.section_index]['words'] * 2 + 5 == len(response)):
-                # call the parser and update data
-                logging.info(f"on_data_received: read operation success")
-                self.__safe_parser(self.sections[self.section_index]['parser'], response)
-            else:
-                logging.info(f"on_data_received: read operation failed: {response.hex()}")
+            request = self.read_plan[self.section_index] if self.section_index < len(self.read_plan) else None
+            if request is not None and self.request_sent is not None:
+                self.__record_request(request['register'], self.request_sent)
+            self.__handle_response(request, response, self.section_index + 1)
+            await self.__read_next()
+        else:
+            logging.warning("on_data_received: unknown operation={}".format(operation))
 
-            if self.section_index >= len(self.sections) - 1: # last section, read complete
-                self.section_index = 0
-                self.on_read_operation_complete()
-                self.data = {}
-                await self.check_polling()
+    # Parses the response to a planned request. A failed merged read is replaced by reads of
+    # its sections, inserted at position in the read plan. response is None when it was lost.
+    def __handle_response(self, request, response, position):
+        if (response is not None and
+            bytes_to_int(response, 1, 1) == READ_SUCCESS and
+            request is not None and
+            request['parser'] != None and
+            request['words'] * 2 + 5 == len(response)):
+            # call the parser and update data
+            logging.info("on_data_received: read operation success")
+            if 'parts' in request:
+                self.__safe_parser(request['parser'], response)
             else:
-                self.section_index += 1
-                await asyncio.sleep(0.5)
-                await self.read_section()
+                self.__parse_section(request, response)
+            self.__adapt_request_gap(True)
+            return
+        READ_FAILURES.inc(device=self.alias, reason='crc' if response is None else 'error' if bytes_to_int(response, 1, 1) == READ_ERROR else 'length')
+        if request is not None and 'parts' in request:
+            logging.warning(f"on_data_received: merged read failed, reading sections separately: {response.hex() if response else 'no response'}")
+            self.__split_merged_read(request, position)
+            self.__adapt_request_gap(False)
         else:
-            logging.warning("on_data_received: unknown operation={}".format(operation))
+            logging.info(f"on_data_received: read operation failed: {response.hex() if response else 'no response'}")
+            self.__adapt_request_gap(False)
+
+    async def __read_next(self):
+        if self.section_index >= len(self.read_plan) - 1: # last section, read complete
+            await self.__read_complete()
+        else:
+            # next request goes out as soon as this response is handled
+            self.section_index += 1
+            if self.request_gap > 0: await asyncio.sleep(self.request_gap)
+            await self.read_section()
+
+    async def __read_complete(self):
+        self.section_index = 0
+        self.__fold_cached_sections()
+        self.on_read_operation_complete()
+        self.data = {}
+        await self.check_polling()
+
+    # Pipelined mode keeps up to pipeline_window read requests in flight. Responses are matched
+    # to requests by slave id (any for broadcast 255), function and expected length, so each
+    # request has its own timeout and a response can't be credited to the wrong section.
+    async def __fill_pipeline(self):
+        while len(self.in_flight) < self.pipeline_window and self.next_index < len(self.read_plan):
+            index = self.next_index
+            self.next_index += 1
+            section = self.read_plan[index]
+            request = {'index': index, 'device_id': section.get('device_id', self.device_id), 'length': section['words'] * 2 + 5, 'sent': time.monotonic()}
+            request['timeout'] = self.loop.call_later(READ_TIMEOUT, self.__on_request_timeout, request)
+            self.in_flight.append(request)
+            await self.ble_manager.characteristic_write_value(self.create_generic_read_request(request['device_id'], 3, section['register'], section['words']))
+            if self.request_gap > 0: await asyncio.sleep(self.request_gap)
 
+    async def __advance_pipeline(self):
+        if len(self.in_flight) == 0 and self.next_index >= len(self.read_plan):
+            await self.__read_complete()
+        else:
+            await self.__fill_pipeline()
+
+    def __match_request(self, response):
+        device_id, function = response[0], response[1]
+        for request in self.in_flight:
+            if request['device_id'] != 255 and request['device_id'] != device_id: continue
+            if function & 0x7f != READ_SUCCESS: continue
+            if function == READ_ERROR or len(response) == request['length']:
+                return request
+        return None
+
+    def __complete_request(self, request, response):
+        request['timeout'].cancel()
+        self.in_flight.remove(request)
+        self.section_index = request['index'] # parsers may look up their plan entry
+        if response is not None:
+            self.__record_request(self.read_plan[request['index']]['register'], request['sent'])
+        self.__handle_response(self.read_plan[request['index']], response, self.next_index)
+
+    def __on_request_timeout(self, request):
+        if request not in self.in_flight: return
+        self.section_index = request['index']
+        self.__cancel_requests()
+        self.on_read_timeout()
+
+    def __cancel_requests(self):
+        for request in self.in_flight:
+            request['timeout'].cancel()
+        self.in_flight = []
+
+    def __record_request(self, register, sent):
+        now = time.monotonic()
+        REQUEST_SECONDS.observe(now - sent, device=self.alias, register=register)
+        TRACER.complete('request', self.alias, sent, now, register=register)
+
+    # Readings carry the wall clock time their read cycle started and completed
     def on_read_operation_complete(self):
         logging.info("on_read_operation_complete")
-        self.data['__device'] = self.config['device']['alias']
+        now = time.monotonic()
+        started = self.cycle_started if self.cycle_started is not None else now
+        self.cycle_started = None
+        READINGS.inc(device=self.alias)
+        TRACER.complete('cycle', self.alias, started, now)
+        self.data['__device'] = self.alias
         self.data['__client'] = self.__class__.__name__
+        self.data['__read_started'] = round(time.time() - (now - started), 3)
+        self.data['__read_completed'] = round(time.time(), 3)
         self.__safe_callback(self.on_data_callback, self.data)
 
     def on_read_timeout(self):
         logging.error("on_read_timeout => Timed out! Please check your device_id!")
+        READ_TIMEOUTS.inc(device=self.alias)
+        request = self.read_plan[self.section_index] if self.section_index < len(self.read_plan) else None
+        if request is not None and 'parts' in request:
+            # device may not tolerate merged reads: the retry after reconnecting reads its sections separately
+            self.__split_merged_read(request, self.section_index)
+        self.__adapt_request_gap(False)
         if self.loop and self.loop.is_running():
             self.loop.create_task(self.__handle_retry_async("Read timeout"))
 
     async def check_polling(self):
-        if self.config['data'].getboolean('enable_polling'): 
-            await asyncio.sleep(self.config['data'].getint('poll_interval'))
+        if self.settings.enable_polling:
+            await asyncio.sleep(self.settings.poll_interval)
             await self.read_section()
 
     async def read_section(self):
@@ -134,10 +327,125 @@ class BaseClient:
         if not getattr(self, 'write_char_uuid', None) or len(self.sections) == 0:
             return logging.info("Nothing to write, skipping operation")
 
+        if index == 0:
+            self.cycle += 1
+            self.read_plan = self.plan_reads(self.due_sections())
+            self.cycle_started = time.monotonic()
+            if len(self.read_plan) == 0:
+                return await self.__read_complete()
+
+        self.frame_assembler.reset() # drop leftovers of an earlier failed response
+        if self.pipeline_window > 1:
+            self.__cancel_requests()
+            self.next_index = index
+            return await self.__fill_pipeline()
         self.read_timeout = self.loop.call_later(READ_TIMEOUT, self.on_read_timeout)
-        request = self.create_generic_read_request(self.device_id, 3, self.sections[index]['register'], self.sections[index]['words']) 
+        self.request_sent = time.monotonic()
+        section = self.read_plan[index]
+        request = self.create_generic_read_request(section.get('device_id', self.device_id), 3, section['register'], section['words'])
         await self.ble_manager.characteristic_write_value(request)
 
+    # Optional pause between requests learned from failures: doubles on every failed
+    # or timed out read, and decays back towards the configured request_gap on success
+    def __adapt_request_gap(self, success):
+        if not self.adaptive_gap: return
+        if success:
+            self.request_gap = max(self.min_request_gap, self.request_gap * 0.9)
+            if self.request_gap < MIN_ADAPTIVE_GAP / 2: self.request_gap = self.min_request_gap
+        else:
+            self.request_gap = min(MAX_ADAPTIVE_GAP, max(MIN_ADAPTIVE_GAP, self.request_gap * 2))
+            logging.info(f"Request gap increased to {self.request_gap:.2f}s")
+
+    # Merges consecutive sections into as few read requests as possible. A section joins the
+    # previous request when it starts at most read_gap registers after it and the combined
+    # read stays within max_read_words. Overlapping or descending sections, or sections of
+    # different slaves (device_id), are never merged.
+    def plan_reads(self, sections):
+        plan = []
+        for section in sections:
+            last = plan[-1] if len(plan) > 0 else None
+            if last is not None:
+                gap = section['register'] - (last['register'] + last['words'])
+                words = section['register'] + section['words'] - last['register']
+                same_slave = section.get('device_id') == last.get('device_id')
+                if 0 <= gap <= self.read_gap and words <= self.max_read_words and same_slave:
+                    if 'parts' not in last:
+                        last = plan[-1] = {'register': last['register'], 'words': last['words'], 'parser': self.__parse_merged_read, 'parts': [last]}
+                        if 'device_id' in last['parts'][0]: last['device_id'] = last['parts'][0]['device_id']
+                    last['words'] = words
+                    last['parts'].append(section)
+                    continue
+            plan.append(section)
+        return plan
+
+    # Slices a merged response back into one frame per section and hands each to its own parser
+    def __parse_merged_read(self, response):
+        request = self.read_plan[self.section_index]
+        for section in request['parts']:
+            start = 3 + (section['register'] - request['register']) * 2
+            frame = bytes(response[0:2]) + bytes([section['words'] * 2]) + bytes(response[start:start + section['words'] * 2])
+            self.__parse_section(section, frame + crc16_modbus(frame))
+
+    # Sections with a refresh policy are parsed into a fresh dict, kept for the cycles they are not read
+    def __parse_section(self, section, frame):
+        if 'refresh' not in section:
+            return self.__safe_parser(section['parser'], frame)
+        owner = getattr(section['parser'], '__self__', self) # a slave client when polled by a hub
+        data, owner.data = owner.data, {}
+        try:
+            self.__safe_parser(section['parser'], frame)
+            fields = owner.data
+        finally:
+            owner.data = data
+        data.update(fields)
+        key = self.__section_key(section)
+        self.section_cache[key] = fields
+        self.section_reads[key] = (self.cycle, time.monotonic(), self.connections)
+
+    def __section_key(self, section):
+        return (section.get('device_id'), section['register'])
+
+    # Sections to read in this cycle
+    def due_sections(self):
+        if not self.section_refresh:
+            return self.sections
+        now = time.monotonic()
+        due = []
+        for section in self.sections:
+            policy = section.get('refresh')
+            last = self.section_reads.get(self.__section_key(section))
+            if policy is None or last is None:
+                due.append(section)
+            elif policy == ONCE_PER_CONNECTION:
+                if last[2] != self.connections: due.append(section)
+            elif policy.cycles is not None and self.cycle - last[0] >= policy.cycles:
+                due.append(section)
+            elif policy.seconds is not None and now - last[1] >= policy.seconds:
+                due.append(section)
+        return due
+
+    # Adds the cached fields of the sections that were not read in this cycle
+    def __fold_cached_sections(self):
+        for section in self.sections:
+            key = self.__section_key(section)
+            if key in self.section_cache and self.section_reads[key][0] != self.cycle:
+                owner = getattr(section['parser'], '__self__', self)
+                owner.data.update(self.section_cache[key])
+
+    # Device rejected a merged read: stop merging and read its sections one by one in this cycle.
+    # When position is the merged read's own entry it is replaced, for a retry of that read.
+    def __split_merged_read(self, request, position):
+        self.read_gap = -1
+        replaced = 1 if position < len(self.read_plan) and self.read_plan[position] is request else 0
+        self.read_plan[position:position + replaced] = request['parts']
+
+    # Decodes a section with the RegisterMap, compiled on first use, into self.data (or data)
+    def decode_section(self, register_map, bs, data = None):
+        decoder = self.decoders.get(register_map)
+        if decoder is None:
+            decoder = self.decoders[register_map] = register_map.compile(self.settings.temperature_unit)
+        return decoder.decode_into(bs, self.data if data is None else data)
+
     def create_generic_read_request(self, device_id, function, regAddr, readWrd):                             
         data = None
         if regAddr != None and readWrd != None:
@@ -179,16 +487,18 @@ class BaseClient:
             if self._retry_count < self.max_retry:
                 self._retry_count += 1
                 delay = 2 ** self._retry_count
+                RETRIES.inc(device=self.alias)
                 logging.info(f"Retrying connection in {delay} seconds (Attempt {self._retry_count}/{self.max_retry}). Reason: {reason}")
                 if self.read_timeout and not self.read_timeout.cancelled():
                     self.read_timeout.cancel()
-                    
+                self.__cancel_requests()
+
                 if self.ble_manager:
                     try:
                         await self.ble_manager.disconnect()
                     except Exception as e:
                         logging.debug(f"Error disconnecting manager client during retry setup: {e}")
-                        
+
                 await asyncio.sleep(delay)
                 await self.connect()
             else:
@@ -198,8 +508,28 @@ class BaseClient:
         finally:
             self._reconnecting = False
 
+    # Takes reloaded settings into use from the next reading, the connection stays up
+    def apply_settings(self, settings):
+        self.settings = settings
+        self.alias = self.config['device']['alias']
+        self.decoders = {} # compiled for the previous temperature unit
+
+    # Waits until the adapter has room for another scan/connect
+    async def __acquire_slot(self):
+        if self.connection_slot is None: return
+        if self.connection_slot.locked():
+            logging.info(f"{self.alias}: waiting for {self.adapter or 'the default adapter'} to finish other connects")
+        await self.connection_slot.acquire()
+
+    def __release_slot(self):
+        if self.connection_slot is not None:
+            self.connection_slot.release()
+
     def stop(self):
+        if self.parent is not None:
+            return self.parent.stop() # slaves share the hub's connection
         if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+        self.__cancel_requests()
         if self.loop is None:
             self.loop = asyncio.get_event_loop()
             self.loop.create_task(self.disconnect())
@@ -211,7 +541,8 @@ class BaseClient:
     def __safe_callback(self, calback, param):
         if calback is not None:
             try:
-                calback(self, param)
+                with TRACER.span('callback', self.alias):
+                    calback(self, param)
             except Exception as e:
                 logging.error(f"__safe_callback => exception in callback! {e}")
                 traceback.print_exc()
@@ -219,7 +550,8 @@ class BaseClient:
     def __safe_parser(self, parser, param):
         if parser is not None:
             try:
-                parser(param)
+                with TRACER.span('parse', self.alias, parser=parser.__name__):
+                    parser(param)
             except Exception as e:
                 logging.error(f"exception in parser! {e}")
                 traceback.print_exc()
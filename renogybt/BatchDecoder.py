@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .Capture import CONNECTED, DISCONNECTED, LOST, NOTIFY, read_capture
+from .FrameAssembler import FrameAssembler
+from .RegisterMap import INT_CODES, SIGN_MAGNITUDE, TEMPERATURE_UNIT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Decodes many fixed-layout frames of one RegisterMap at once with NumPy, for offline analysis
+# of recorded frames. The buffer (or a memory-mapped file) is viewed as an array of a structured
+# dtype and every field is converted column-wise with the same scaling, sign handling, enums
+# and temperature unit as RegisterDecoder (np.round may differ by 0.01 on values ending in 5).
+# The result is one array per field.
+# Repeated fields beyond their count_field are masked. NumPy is only needed for this module.
+#
+#   decoder = BatchDecoder(CHARGING_INFO, frame_size=73, temperature_unit='C')
+#   columns = decoder.decode_file('charging_info.bin', processes=4)
+#   columns['battery_voltage'].mean()
+#
+#   columns = decoder.decode_capture('renogy.cap', 'BT-TH-B00FXXXX')
+
+CHUNK_FRAMES = 1 << 20 # frames per process pool task
+
+class BatchDecoder:
+    def __init__(self, register_map, frame_size=None, temperature_unit='F'):
+        if np is None:
+            raise ImportError("BatchDecoder requires numpy, install it with: python3 -m pip install numpy")
+        self.register_map = register_map
+        self.temperature_unit = temperature_unit.strip()
+        self.slots = list(register_map.slots())
+        end = max(offset + field.width for _, offset, field in self.slots)
+        self.frame_size = frame_size or end
+        if self.frame_size < end:
+            raise ValueError(f"frame_size {self.frame_size} is smaller than the last field end {end}")
+        self.dtype = np.dtype({
+            'names': [name for name, _, _ in self.slots],
+            'formats': [self.__format(field) for _, _, field in self.slots],
+            'offsets': [offset for _, offset, _ in self.slots],
+            'itemsize': self.frame_size
+        })
+
+    def __format(self, field):
+        if field.text: return f'S{field.width}'
+        if field.width not in INT_CODES: return ('u1', (field.width,)) # e.g. 3 byte values, combined later
+        return f"{'>i' if field.signed is True else '>u'}{field.width}"
+
+    # Decodes every whole frame of a bytes-like object into {field: array}
+    def decode(self, buffer):
+        frames = np.frombuffer(buffer, dtype=self.dtype, count=len(buffer) // self.frame_size)
+        columns = {name: self.__convert(frames[name], field) for name, _, field in self.slots}
+        for field in self.register_map.fields:
+            if field.count_field is None: continue
+            valid = columns[field.count_field]
+            for i in range(field.count):
+                name = f'{field.name}_{i}'
+                columns[name] = np.ma.masked_where(valid <= i, columns[name])
+        return columns
+
+    # Decodes a file of concatenated frames through a memory map, split across processes if asked
+    def decode_file(self, path, offset=0, processes=None, chunk_frames=CHUNK_FRAMES):
+        count = (os.path.getsize(path) - offset) // self.frame_size
+        if not processes or processes <= 1 or count <= chunk_frames:
+            return self.decode_range(path, offset, count)
+        chunks = [(path, offset + start * self.frame_size, min(chunk_frames, count - start)) for start in range(0, count, chunk_frames)]
+        with ProcessPoolExecutor(processes) as pool:
+            parts = list(pool.map(self.decode_range, *zip(*chunks)))
+        return {name: concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def decode_range(self, path, offset, count):
+        if count <= 0: return self.decode(b'')
+        mapped = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(count * self.frame_size,))
+        return self.decode(mapped)
+
+    # Decodes one device's frames of this layout from a Capture file, with the time they were
+    # received as '__time'. Notifications are reassembled into CRC checked Modbus frames first,
+    # modbus=False takes them as they are (shunt). Frames of frame_size bytes are decoded,
+    # accept(frame) can narrow them down further, e.g. lambda frame: frame[1] == 87.
+    def decode_capture(self, path, alias, accept=None, modbus=True):
+        track = read_capture(path).get(alias)
+        if track is None:
+            raise ValueError(f"{path} has no device {alias}")
+        assembler = FrameAssembler()
+        frames, times = [], []
+        for event in track.events:
+            if event.kind in (CONNECTED, DISCONNECTED, LOST):
+                assembler.reset()
+            if event.kind != NOTIFY: continue
+            for frame in assembler.feed(event.data) if modbus else [event.data]:
+                if len(frame) == self.frame_size and (accept is None or accept(frame)):
+                    frames.append(frame)
+                    times.append(event.time)
+        columns = self.decode(b''.join(frames))
+        columns['__time'] = np.array(times, dtype=float)
+        return columns
+
+    # Same steps and order as Field.converter
+    def __convert(self, values, field):
+        if field.text:
+            return np.char.strip(np.char.decode(values, 'utf-8'))
+        if field.width not in INT_CODES:
+            raw = values.astype(np.int64)
+            values = np.zeros(len(raw), dtype=np.int64)
+            for i in range(field.width):
+                values = (values << 8) | raw[:, i]
+            if field.signed is True:
+                sign = 1 << (8 * field.width - 1)
+                values = np.where(values & sign, values - (sign << 1), values)
+        else:
+            values = values.astype(np.int64)
+        if field.shift:
+            values = values >> field.shift
+        if field.signed == SIGN_MAGNITUDE:
+            values = np.where(values >> 7 == 1, -(values - 128), values)
+        if field.scale != 1:
+            values = np.round(values * field.scale, 2)
+        if field.enum is not None:
+            codes, inverse = np.unique(values, return_inverse=True)
+            labels = np.empty(len(codes), dtype=object)
+            labels[:] = [field.enum.get(code.item()) for code in codes]
+            values = labels[inverse]
+        if field.unit == TEMPERATURE_UNIT and self.temperature_unit == 'F':
+            values = (values * 9/5) + 32
+        return values
+
+def concatenate(arrays):
+    if any(isinstance(a, np.ma.MaskedArray) for a in arrays):
+        return np.ma.concatenate(arrays)
+    return np.concatenate(arrays)
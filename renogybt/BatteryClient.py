@@ -1,5 +1,5 @@
-from .BaseClient import BaseClient
-from .Utils import bytes_to_int, format_temperature
+from .BaseClient import BaseClient, ONCE_PER_CONNECTION
+from .RegisterMap import Field, RegisterMap
 
 # Client for Renogy LFP battery with built-in bluetooth / BT-2 module
 
@@ -8,6 +8,35 @@ FUNCTION = {
     6: "WRITE"
 }
 
+CELL_VOLT_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('cell_count', 3),
+    Field('cell_voltage', 5, scale=0.1, unit='V', count=16, count_field='cell_count')
+)
+
+CELL_TEMP_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('sensor_count', 3),
+    Field('temperature', 5, signed=True, scale=0.1, unit='C', count=16, count_field='sensor_count')
+)
+
+BATTERY_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('current', 3, signed=True, scale=0.01, unit='A'),
+    Field('voltage', 5, scale=0.1, unit='V'),
+    Field('remaining_charge', 7, 4, scale=0.001, unit='Ah'),
+    Field('capacity', 11, 4, scale=0.001, unit='Ah')
+)
+
+DEVICE_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('model', 3, 16, text=True)
+)
+
+DEVICE_ADDRESS = RegisterMap(
+    Field('device_id', 3)
+)
+
 class BatteryClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -18,43 +47,21 @@ class BatteryClient(BaseClient):
             {'register': 5000, 'words': 17, 'parser': self.parse_cell_volt_info},
             {'register': 5017, 'words': 17, 'parser': self.parse_cell_temp_info},
             {'register': 5042, 'words': 6, 'parser': self.parse_battery_info},
-            {'register': 5122, 'words': 8, 'parser': self.parse_device_info},
-            {'register': 5223, 'words': 1, 'parser': self.parse_device_address}
+            {'register': 5122, 'words': 8, 'parser': self.parse_device_info, 'refresh': ONCE_PER_CONNECTION},
+            {'register': 5223, 'words': 1, 'parser': self.parse_device_address, 'refresh': ONCE_PER_CONNECTION}
         ]
 
     def parse_cell_volt_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['cell_count'] = bytes_to_int(bs, 3, 2)
-        for i in range(0, data['cell_count']):
-            data[f'cell_voltage_{i}'] = bytes_to_int(bs, 5 + i*2, 2, scale = 0.1)
-        self.data.update(data)
+        self.decode_section(CELL_VOLT_INFO, bs)
 
     def parse_cell_temp_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['sensor_count'] = bytes_to_int(bs, 3, 2)
-        for i in range(0, data['sensor_count']):
-            celcius = bytes_to_int(bs, 5 + i*2, 2, scale = 0.1, signed = True)
-            data[f'temperature_{i}'] = format_temperature(celcius, self.config['data']['temperature_unit'])
-        self.data.update(data)
+        self.decode_section(CELL_TEMP_INFO, bs)
 
     def parse_battery_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['current'] = bytes_to_int(bs, 3, 2, True, scale = 0.01)
-        data['voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['remaining_charge'] = bytes_to_int(bs, 7, 4, scale = 0.001)
-        data['capacity'] = bytes_to_int(bs, 11, 4, scale = 0.001)
-        self.data.update(data)
+        self.decode_section(BATTERY_INFO, bs)
 
     def parse_device_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['model'] = (bs[3:19]).decode('utf-8').rstrip('\x00')
-        self.data.update(data)
+        self.decode_section(DEVICE_INFO, bs)
 
     def parse_device_address(self, bs):
-        data = {}
-        data['device_id'] = bytes_to_int(bs, 3, 2)
-        self.data.update(data)
+        self.decode_section(DEVICE_ADDRESS, bs)
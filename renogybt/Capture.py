@@ -0,0 +1,93 @@
+import logging
+import struct
+import threading
+import time
+from collections import namedtuple
+
+# Raw capture of the bluetooth traffic: every request written and every notification received,
+# with connects and disconnects, timestamped with time.monotonic() relative to open().
+# Captures are compact binary files that Replay feeds back through the clients and parsers.
+# Recording is off until open() is called, record() is then a no-op.
+#
+#   RECORDER.open('renogy.cap')
+#   RECORDER.record(WRITE, 'BT-TH-B00FXXXX', request)
+#
+# File: MAGIC, then records of HEADER (kind, seconds, device index, length) + payload.
+# The first record of a device is DEVICE with "alias<tab>mac_addr" as payload.
+
+MAGIC = b'RBTCAP1\n'
+HEADER = struct.Struct('<cdHH')
+
+DEVICE = b'A'
+CONNECTED = b'C'
+DISCONNECTED = b'D' # disconnect requested by the client
+LOST = b'L' # unexpected disconnect
+WRITE = b'W'
+NOTIFY = b'N'
+
+Event = namedtuple('Event', ['kind', 'time', 'data'])
+Track = namedtuple('Track', ['alias', 'mac_addr', 'events'])
+
+class Recorder:
+    def __init__(self):
+        self.file = None
+        self.lock = threading.Lock()
+        self.devices = {} # alias => device index
+        self.started = 0
+
+    def open(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.devices = {}
+        self.started = time.monotonic()
+        logging.info(f"Capturing bluetooth traffic to {path}")
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    def record(self, kind, alias, data=b'', mac_addr=''):
+        if self.file is None: return
+        with self.lock:
+            if self.file is None: return
+            now = time.monotonic() - self.started
+            index = self.devices.get(alias)
+            if index is None:
+                index = self.devices[alias] = len(self.devices)
+                self.__write(DEVICE, now, index, f"{alias}\t{mac_addr}".encode('utf-8'))
+            self.__write(kind, now, index, bytes(data))
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def __write(self, kind, now, index, payload):
+        self.file.write(HEADER.pack(kind, now, index, len(payload)) + payload)
+
+# Reads a capture into one Track per device, keyed by alias
+def read_capture(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    if not content.startswith(MAGIC):
+        raise ValueError(f"{path} is not a capture file")
+    tracks = {}
+    names = {} # device index => alias
+    offset = len(MAGIC)
+    while offset + HEADER.size <= len(content):
+        kind, seconds, index, length = HEADER.unpack_from(content, offset)
+        offset += HEADER.size
+        payload = content[offset:offset + length]
+        offset += length
+        if len(payload) < length:
+            break # truncated by a crash while recording
+        if kind == DEVICE:
+            alias, mac_addr = payload.decode('utf-8').split('\t', 1)
+            names[index] = alias
+            tracks[alias] = Track(alias, mac_addr, [])
+        elif index in names:
+            tracks[names[index]].events.append(Event(kind, seconds, payload))
+    return tracks
+
+RECORDER = Recorder()
@@ -0,0 +1,48 @@
+import time
+
+# Reduces readings to the fields that changed since they were last published.
+# Numeric fields can have a deadband, either absolute ("battery_voltage:0.1") or relative to
+# the last published value ("pv_power:5%"), other fields are published whenever they differ.
+# Every heartbeat seconds the full reading is passed through so consumers can resync.
+
+HEARTBEAT = 300 # (seconds)
+METADATA_PREFIX = '__' # __device, __client, __read_started...: always included in a delta, never a change on their own
+
+# Parses "field:amount, field:amount%" into {field: (amount, is_percent)}
+def parse_deadbands(deadband_str):
+    deadbands = {}
+    for item in [x.strip() for x in deadband_str.split(',') if x.strip()]:
+        field, amount = [x.strip() for x in item.split(':', 1)]
+        percent = amount.endswith('%')
+        deadbands[field] = (float(amount.rstrip('%')), percent)
+    return deadbands
+
+class ChangeFilter:
+    def __init__(self, deadbands=None, heartbeat=HEARTBEAT):
+        self.deadbands = deadbands or {}
+        self.heartbeat = heartbeat
+        self.published = {} # device => values last published
+        self.last_full = {} # device => time of the last full publish
+
+    # Returns the full reading on a heartbeat, otherwise only the changed fields, or None if nothing changed
+    def filter(self, device, data, now=None):
+        now = now if now is not None else time.monotonic()
+        published = self.published.setdefault(device, {})
+        if now - self.last_full.get(device, float('-inf')) >= self.heartbeat:
+            self.last_full[device] = now
+            self.published[device] = dict(data)
+            return data
+        changes = {key: value for key, value in data.items() if key.startswith(METADATA_PREFIX) or self.__changed(key, published, value)}
+        if all(key.startswith(METADATA_PREFIX) for key in changes):
+            return None
+        published.update(changes)
+        return changes
+
+    def __changed(self, key, published, value):
+        if key not in published: return True
+        last = published[key]
+        if key in self.deadbands and isinstance(value, (int, float)) and isinstance(last, (int, float)):
+            amount, percent = self.deadbands[key]
+            band = abs(last) * amount / 100 if percent else amount
+            return round(abs(value - last), 6) >= band and value != last
+        return value != last
@@ -1,6 +1,7 @@
 import logging
-from .BaseClient import BaseClient
-from .Utils import bytes_to_int, parse_temperature
+from .BaseClient import BaseClient, ONCE_PER_CONNECTION, Refresh
+from .RegisterMap import Field, RegisterMap, SIGN_MAGNITUDE
+from .Utils import bytes_to_int
 
 FUNCTION = {
     3: "READ",
@@ -26,58 +27,70 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+DEVICE_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('model', 3, 16, text=True)
+)
+
+DEVICE_ADDRESS = RegisterMap(
+    Field('device_id', 4, 1)
+)
+
+CHARGING_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_percentage', 3, unit='%'),
+    Field('battery_voltage', 5, scale=0.1, unit='V'),
+    Field('combined_charge_current', 7, scale=0.01, unit='A'),
+    Field('controller_temperature', 9, 1, signed=SIGN_MAGNITUDE, unit='C'),
+    Field('battery_temperature', 10, 1, signed=SIGN_MAGNITUDE, unit='C'),
+    Field('alternator_voltage', 11, scale=0.1, unit='V'),
+    Field('alternator_current', 13, scale=0.01, unit='A'),
+    Field('alternator_power', 15, unit='W'),
+    Field('pv_voltage', 17, scale=0.1, unit='V'),
+    Field('pv_current', 19, scale=0.01, unit='A'),
+    Field('pv_power', 21, unit='W'),
+    Field('battery_min_voltage_today', 25, scale=0.1, unit='V'),
+    Field('battery_max_voltage_today', 27, scale=0.1, unit='V'),
+    Field('battery_max_current_today', 29, scale=0.01, unit='A'),
+    Field('max_charging_power_today', 33, unit='W'),
+    Field('charging_amp_hours_today', 37, unit='Ah'),
+    Field('power_generation_today', 41, unit='Wh'),
+    Field('total_working_days', 45),
+    Field('count_battery_overdischarged', 47),
+    Field('count_battery_fully_charged', 49),
+    Field('battery_ah_total_accumulated', 51, 4, unit='Ah'),
+    Field('power_generation_total', 59, 4, unit='Wh')
+)
+
+BATTERY_TYPE_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_type', 3, enum=BATTERY_TYPE)
+)
+
 class DCChargerClient(BaseClient):
+    max_pipeline_window = 2 # BT-1 modules buffer little
+
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
         self.on_data_callback = on_data_callback
         self.on_error_callback = on_error_callback
         self.data = {}
         self.sections = [
-            {'register': 12, 'words': 8, 'parser': self.parse_device_info},
-            {'register': 26, 'words': 1, 'parser': self.parse_device_address},
+            {'register': 12, 'words': 8, 'parser': self.parse_device_info, 'refresh': ONCE_PER_CONNECTION},
+            {'register': 26, 'words': 1, 'parser': self.parse_device_address, 'refresh': ONCE_PER_CONNECTION},
             {'register': 256, 'words': 30, 'parser': self.parse_charging_info},
             {'register': 288, 'words': 3, 'parser': self.parse_state},
-            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type}
+            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type, 'refresh': Refresh(seconds=300)}
         ]
 
     def parse_device_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['model'] = (bs[3:19]).decode('utf-8').strip()
-        self.data.update(data)
+        self.decode_section(DEVICE_INFO, bs)
 
     def parse_device_address(self, bs):
-        data = {}
-        data['device_id'] = bytes_to_int(bs, 4, 1)
-        self.data.update(data)
+        self.decode_section(DEVICE_ADDRESS, bs)
 
     def parse_charging_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_percentage'] = bytes_to_int(bs, 3, 2)
-        data['battery_voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['combined_charge_current'] = bytes_to_int(bs, 7, 2, scale = 0.01)
-        data['controller_temperature'] = parse_temperature(bytes_to_int(bs, 9, 1), temp_unit)
-        data['battery_temperature'] = parse_temperature(bytes_to_int(bs, 10, 1), temp_unit)
-        data['alternator_voltage'] = bytes_to_int(bs, 11, 2, scale = 0.1)
-        data['alternator_current'] = bytes_to_int(bs, 13, 2, scale = 0.01)
-        data['alternator_power'] = bytes_to_int(bs, 15, 2)
-        data['pv_voltage'] = bytes_to_int(bs, 17, 2, scale = 0.1) 
-        data['pv_current'] = bytes_to_int(bs, 19, 2, scale = 0.01)
-        data['pv_power'] = bytes_to_int(bs, 21, 2)
-        data['battery_min_voltage_today'] = bytes_to_int(bs, 25, 2, scale=0.1)
-        data['battery_max_voltage_today'] = bytes_to_int(bs, 27, 2, scale=0.1)
-        data['battery_max_current_today'] = bytes_to_int(bs, 29, 2, scale=0.01)
-        data['max_charging_power_today'] = bytes_to_int(bs, 33, 2)
-        data['charging_amp_hours_today'] = bytes_to_int(bs, 37, 2)
-        data['power_generation_today'] = bytes_to_int(bs, 41, 2)
-        data['total_working_days'] = bytes_to_int(bs, 45, 2)
-        data['count_battery_overdischarged'] = bytes_to_int(bs, 47, 2)
-        data['count_battery_fully_charged'] = bytes_to_int(bs, 49, 2)
-        data['battery_ah_total_accumulated'] = bytes_to_int(bs, 51, 4)
-        data['power_generation_total'] = bytes_to_int(bs, 59, 4)
-        self.data.update(data)
+        self.decode_section(CHARGING_INFO, bs)
 
     def parse_state(self, bs):
         data = {}
@@ -108,7 +121,4 @@ class DCChargerClient(BaseClient):
         self.data.update(data)
 
     def parse_battery_type(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_type'] = BATTERY_TYPE.get(bytes_to_int(bs, 3, 2))
-        self.data.update(data)
+        self.decode_section(BATTERY_TYPE_INFO, bs)
@@ -1,39 +1,403 @@
+import asyncio
+import gzip
 import json
 import logging
+import os
+import threading
+import time
+from collections import deque
 import requests
-import paho.mqtt.publish as publish
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import paho.mqtt.client as mqtt
+from collections import namedtuple
 from configparser import ConfigParser
-from datetime import datetime
+from .ChangeFilter import ChangeFilter
+from .Metrics import SINK_DROPPED, SINK_FAILURES, SINK_SECONDS
+from .PVOutput import MIN_REQUEST_INTERVAL, PVOutput, parse_system_ids
+from .Settings import SINK_SECTIONS, Settings
+from .Spool import Spool
+from .TimeSeriesStore import TimeSeriesStore
 
-PVOUTPUT_URL = 'http://pvoutput.org/service/r2/addstatus.jsp'
+QUEUE_SIZE = 100 # readings buffered per sink
+SINK_TIMEOUT = 15 # max time a sink may take to deliver one batch (seconds)
+DROP_OLDEST = 'drop_oldest' # queue policy: discard the oldest reading when a sink falls behind
+OVERFLOW = 'overflow' # queue policy: hold up to another queue_size readings until the queue has room, then drop the oldest
+SPOOL_RETRY_INTERVAL = 30 # how often delivery of spooled readings is retried (seconds)
+HTTP_RETRIES = 3 # retries of a failed upload, with exponential backoff
+HTTP_BACKOFF = 1 # backoff factor, retries wait at most 1, 2, 4... seconds
+HTTP_SINKS = ('remote_logging', 'pvoutput') # their timeout is per request, the sink waits for every retry
+MQTT_CLIENT_ID = 'renogy-bt' # prefix, the device alias is appended
+MQTT_KEEPALIVE = 60 # (seconds)
+MQTT_MAX_INFLIGHT = 20 # unacknowledged QoS 1/2 messages allowed on the connection
+MQTT_MAX_QUEUED = 1000 # QoS 1/2 messages held while the broker is unreachable
+MQTT_CONNECT_TIMEOUT = 5 # wait for the first connection before publishing (seconds)
+
+Reading = namedtuple('Reading', ['timestamp', 'device', 'device_type', 'data'])
+
+# Delivers readings to one destination from its own bounded queue and worker task.
+# send() is a blocking function taking a list of readings, run in a thread so the
+# event loop (and with it the BLE notifications) never waits on network I/O.
+# With a spool, batches that fail are stored on disk and replayed in order once the
+# destination is reachable again; new readings queue up behind the spooled ones.
+# put() is called from the BLE notification path and never waits: with the overflow policy a full
+# queue parks readings in an overflow of the same size that the worker moves into the queue as
+# it frees up. A short stall loses nothing, a longer one still drops the oldest readings.
+# With deltas the sink gets the change filtered readings when [data] change_only is set.
+# idle() is run in a thread every idle_interval seconds without readings, e.g. to send held uploads.
+class Sink:
+    def __init__(self, name, send, batch_size=1, batch_window=0, timeout=SINK_TIMEOUT, queue_size=QUEUE_SIZE, policy=DROP_OLDEST, accepts=None, spool=None, deltas=False,
+                 idle=None, idle_interval=None):
+        self.name = name
+        self.send = send
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.defaults = (batch_size, batch_window) # when the sink's section does not set them
+        self.timeout = timeout
+        self.policy = policy
+        self.accepts = accepts
+        self.spool = spool
+        self.deltas = deltas
+        self.idle = idle
+        self.idle_interval = idle_interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflow = deque() # readings waiting for room in the queue (overflow policy)
+        self.task = None
+        self.dropped = 0
+
+    def put(self, reading):
+        if self.accepts is not None and not self.accepts(reading):
+            return
+        if self.queue.full():
+            if self.policy == OVERFLOW:
+                if len(self.overflow) >= self.queue.maxsize:
+                    self.overflow.popleft()
+                    self.__dropped()
+                self.overflow.append(reading)
+                return
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.__dropped()
+        self.queue.put_nowait(reading)
+
+    def __dropped(self):
+        self.dropped += 1
+        SINK_DROPPED.inc(sink=self.name)
+        logging.warning(f"{self.name}: queue full, dropped oldest reading ({self.dropped} so far)")
+
+    # Moves parked readings into the queue, before the taken ones are marked done so join() keeps waiting
+    def __refill(self):
+        while self.overflow and not self.queue.full():
+            self.queue.put_nowait(self.overflow.popleft())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            spooled = self.spool is not None and not self.spool.empty()
+            timeout = SPOOL_RETRY_INTERVAL if spooled else None
+            if self.idle is not None:
+                timeout = min(timeout or self.idle_interval, self.idle_interval)
+            try:
+                batch = [await asyncio.wait_for(self.queue.get(), timeout)]
+            except asyncio.TimeoutError:
+                if spooled: await self.drain()
+                if self.idle is not None: await self.__run_idle()
+                continue
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0: break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.__refill()
+            try:
+                if spooled:
+                    await loop.run_in_executor(None, self.spool.append, batch) # keep order behind the backlog
+                    await self.drain()
+                elif not await self.deliver(batch) and self.spool is not None:
+                    logging.info(f"{self.name}: spooling {len(batch)} readings")
+                    await loop.run_in_executor(None, self.spool.append, batch)
+            finally:
+                for _ in batch: self.queue.task_done()
+
+    async def __run_idle(self):
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.idle)
+        except Exception as e:
+            logging.error(f"{self.name}: {e}")
+
+    # A send that overruns the timeout is still waited for: its thread can't be stopped, and
+    # spooling the batch while it may still get through would deliver it twice
+    async def deliver(self, batch):
+        started = time.monotonic()
+        sending = asyncio.get_running_loop().run_in_executor(None, self.send, batch)
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(sending), self.timeout)
+            except asyncio.TimeoutError:
+                logging.error(f"{self.name}: delivery still running after {self.timeout}s, waiting for it to finish")
+                await sending
+            SINK_SECONDS.observe(time.monotonic() - started, sink=self.name)
+            return True
+        except Exception as e:
+            logging.error(f"{self.name}: delivery failed: {e}")
+        SINK_FAILURES.inc(sink=self.name)
+        return False
+
+    # Replays spooled readings oldest first, stopping at the first failed delivery
+    async def drain(self):
+        loop = asyncio.get_running_loop()
+        while not self.spool.empty():
+            batch, position = await loop.run_in_executor(None, self.spool.read, self.batch_size)
+            if len(batch) > 0 and not await self.deliver(batch):
+                return
+            await loop.run_in_executor(None, self.spool.commit, position)
+            if len(batch) == 0: return
+
+# Longest an upload through http_session() can take with every retry: each attempt may use
+# the whole per request timeout, plus the backoff between them
+def http_budget(timeout):
+    return (HTTP_RETRIES + 1) * timeout + sum(HTTP_BACKOFF * 2 ** retry for retry in range(HTTP_RETRIES))
 
 class DataLogger:
     def __init__(self, config: ConfigParser):
         self.config = config
+        self.settings = Settings(config)
+        self.sinks = None
+        self.mqtt_clients = {} # device alias => (paho client, last publish info)
+        self.http = None
+        self.pvoutputs = {} # controller alias => PVOutput, None when it has no system
+        self.store = None # TimeSeriesStore when [local_store] is enabled, can be queried by dashboards
+        self.stale = set() # sinks whose connection options changed on reload, reopened by their worker
+        self.change_filter = None
+        self.__configure_change_filter()
+
+    # Queues a reading for every enabled sink and returns immediately. Sinks taking deltas
+    # (remote logging, mqtt) get the changed fields only, the others the full reading.
+    def submit(self, client, json_data):
+        if self.sinks is None:
+            self.sinks = self.create_sinks()
+            for sink in self.sinks:
+                sink.task = asyncio.get_running_loop().create_task(sink.run())
+        device = client.config['device']
+        reading = Reading(time.time(), device['alias'], device['type'], json_data)
+        delta = reading
+        if self.change_filter and any(sink.deltas for sink in self.sinks):
+            changes = self.change_filter.filter(device['alias'], json_data)
+            delta = reading._replace(data=changes) if changes else None
+        for sink in self.sinks:
+            if not sink.deltas:
+                sink.put(reading)
+            elif delta is not None:
+                sink.put(delta)
+
+    def __configure_change_filter(self):
+        if not self.settings.change_only:
+            self.change_filter = None
+        elif self.change_filter is None:
+            self.change_filter = ChangeFilter(self.settings.deadbands, self.settings.heartbeat)
+        else:
+            self.change_filter.deadbands, self.change_filter.heartbeat = self.settings.deadbands, self.settings.heartbeat
+
+    # Waits for queued readings to be delivered, then stops the sink workers
+    async def close(self, timeout=SINK_TIMEOUT):
+        if not self.sinks: return
+        try:
+            await asyncio.wait_for(asyncio.gather(*[sink.queue.join() for sink in self.sinks]), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("DataLogger: closing with undelivered readings")
+        for sink in self.sinks:
+            sink.task.cancel()
+            if sink.spool: sink.spool.close()
+        self.close_mqtt()
+        for pvoutput in self.pvoutputs.values():
+            if pvoutput is None: continue
+            pvoutput.close_interval()
+            await asyncio.get_running_loop().run_in_executor(None, pvoutput.flush)
+        if self.store: self.store.close()
+
+    def create_sinks(self, sections=SINK_SECTIONS):
+        sinks = []
+        enabled = lambda section: section in sections and self.settings.sinks[section]['enabled']
+        if enabled('remote_logging'):
+            sinks.append(self.__sink('remote_logging', lambda batch: self.log_remote_batch([r.data for r in batch]), deltas=True))
+        if enabled('mqtt'):
+            sinks.append(self.__sink('mqtt', lambda batch: [self.log_mqtt(r.data, r.device) for r in batch], deltas=True))
+        if enabled('pvoutput'):
+            sinks.append(self.__sink('pvoutput', self.log_pvoutput_batch, spool=None, idle=self.flush_pvoutput, idle_interval=MIN_REQUEST_INTERVAL,
+                accepts=lambda reading: reading.device_type == 'RNG_CTRL'))
+        if enabled('local_store'):
+            options = self.settings.sinks['local_store']
+            if self.store is None:
+                self.store = TimeSeriesStore(options.get('path', 'renogy.db'), options.get('retention_days', 7))
+            sinks.append(self.__sink('local_store', lambda batch: self.store.insert([(r.timestamp, r.device, r.data) for r in batch]),
+                batch_size=50, batch_window=10, spool=None))
+        return sinks
+
+    # batch_size and batch_window passed in are the defaults when the section does not set them
+    def __sink(self, section, send, batch_size=1, batch_window=0, **kwargs):
+        if 'spool' not in kwargs:
+            kwargs['spool'] = self.__spool(section)
+        sink = Sink(section, send, batch_size, batch_window, queue_size=self.settings.queue_size, **kwargs)
+        self.__configure(sink)
+        return sink
+
+    def __configure(self, sink):
+        options = self.settings.sinks[sink.name]
+        sink.batch_size = options.get('batch_size', sink.defaults[0])
+        sink.batch_window = options.get('batch_window', sink.defaults[1])
+        timeout = options.get('timeout', SINK_TIMEOUT)
+        sink.timeout = http_budget(timeout) if sink.name in HTTP_SINKS else timeout
+        sink.policy = self.settings.queue_policy
+
+    def __spool(self, section):
+        if not self.settings.spool_dir: return None
+        return Spool(os.path.join(self.settings.spool_dir, section), max_size=self.settings.spool_max_size, decode=Reading._make)
+
+    # Applies reloaded settings while running: running sinks take the new batching, sinks are
+    # started or stopped as they are enabled or disabled, mqtt and pvoutput reopen with new options
+    def reload(self, settings):
+        previous, self.settings = self.settings, settings
+        self.__configure_change_filter()
+        self.stale.update(section for section in ('mqtt', 'pvoutput') if previous.sinks[section] != settings.sinks[section])
+        if self.sinks is None: return # not started yet, created from the new settings on first submit
+        running = []
+        for sink in self.sinks:
+            if settings.sinks[sink.name]['enabled']:
+                self.__configure(sink)
+                running.append(sink)
+                continue
+            logging.info(f"DataLogger: stopping {sink.name}, {sink.queue.qsize()} queued readings dropped")
+            sink.task.cancel()
+            if sink.spool: sink.spool.close()
+        started = self.create_sinks([section for section in SINK_SECTIONS if section not in [sink.name for sink in running]])
+        for sink in started:
+            sink.task = asyncio.get_running_loop().create_task(sink.run())
+            logging.info(f"DataLogger: started {sink.name}")
+        self.sinks = running + started
 
     def log_remote(self, json_data):
-        headers = { "Authorization" : f"Bearer {self.config['remote_logging']['auth_header']}" }
-        req = requests.post(self.config['remote_logging']['url'], json = json_data, timeout=15, headers=headers)
-        logging.info("Log remote 200") if req.status_code == 200 else logging.error(f"Log remote error {req.status_code}")
-
-    def log_mqtt(self, json_data):
-        logging.info(f"mqtt logging")
-        user = self.config['mqtt']['user']
-        password = self.config['mqtt']['password']
-        auth = None if not user or not password else {"username": user, "password": password}
-
-        publish.single(
-            self.config['mqtt']['topic'], payload=json.dumps(json_data),
-            hostname=self.config['mqtt']['server'], port=self.config['mqtt'].getint('port'),
-            auth=auth, client_id="renogy-bt"
-        )
-
-    def log_pvoutput(self, json_data):
-        date_time = datetime.now().strftime("d=%Y%m%d&t=%H:%M")
-        data = f"{date_time}&v1={json_data['power_generation_today']}&v2={json_data['pv_power']}&v3={json_data['power_consumption_today']}&v4={json_data['load_power']}&v5={json_data['controller_temperature']}&v6={json_data['battery_voltage']}"
-        response = requests.post(PVOUTPUT_URL, data=data, headers={
-            "Content-Type": "application/x-www-form-urlencoded",
-            "X-Pvoutput-Apikey": self.config['pvoutput']['api_key'],
-            "X-Pvoutput-SystemId":  self.config['pvoutput']['system_id']
-        })
-        print(f"pvoutput {response}")
+        self.log_remote_batch([json_data])
+
+    # A single reading is posted as a JSON object, as it always was. With batch_size > 1 the
+    # readings are posted together as a JSON array, gzip compressed unless compress = false.
+    def log_remote_batch(self, batch):
+        options = self.settings.sinks['remote_logging']
+        headers = { "Authorization" : f"Bearer {options.get('auth_header', '')}", "Content-Type": "application/json" }
+        batched = options.get('batch_size', 1) > 1
+        body = json.dumps(batch if batched else batch[0]).encode('utf-8')
+        if batched and options.get('compress', True):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        req = self.http_session().post(options['url'], data=body, timeout=options.get('timeout', SINK_TIMEOUT), headers=headers)
+        if req.status_code == 200:
+            logging.info(f"Log remote 200 ({len(batch)} readings)")
+        else:
+            logging.error(f"Log remote error {req.status_code}")
+            req.raise_for_status()
+
+    # Shared session so uploads reuse keep-alive connections, with retries on connection
+    # errors and 429/5xx responses
+    def http_session(self):
+        if self.http is None:
+            # Retry-After is not honoured so a retried upload always ends within http_budget()
+            retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None,
+                raise_on_status=False, respect_retry_after_header=False)
+            self.http = requests.Session()
+            self.http.mount('http://', HTTPAdapter(max_retries=retry))
+            self.http.mount('https://', HTTPAdapter(max_retries=retry))
+        return self.http
+
+    # Publishes on a long-lived connection per device, opened on first use. paho's network
+    # thread handles keepalive and reconnects, QoS 1/2 messages are resent after a reconnect.
+    def log_mqtt(self, json_data, device = None):
+        device = device or json_data.get('__device', '')
+        if 'mqtt' in self.stale:
+            self.stale.discard('mqtt')
+            self.close_mqtt() # reconnect with the reloaded options
+        options = self.settings.sinks['mqtt']
+        client = self.mqtt_client(device)
+        qos = options.get('qos', 0)
+        info = client.publish(options['topic'], payload=json.dumps(json_data), qos=qos)
+        if qos == 0 and info.rc == mqtt.MQTT_ERR_NO_CONN: # QoS 1/2 messages stay queued in paho until reconnected
+            raise ConnectionError("mqtt broker not connected")
+        self.mqtt_clients[device] = (client, info)
+
+    def mqtt_client(self, device):
+        if device in self.mqtt_clients:
+            return self.mqtt_clients[device][0]
+
+        options = self.settings.sinks['mqtt']
+        client_id = f"{options.get('client_id', MQTT_CLIENT_ID)}-{device}"
+        if hasattr(mqtt, 'CallbackAPIVersion'): # paho-mqtt >= 2.0
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            client = mqtt.Client(client_id=client_id)
+        if options.get('user') and options.get('password'):
+            client.username_pw_set(options['user'], options['password'])
+        client.max_inflight_messages_set(options.get('max_inflight', MQTT_MAX_INFLIGHT))
+        client.max_queued_messages_set(MQTT_MAX_QUEUED)
+        client.reconnect_delay_set(min_delay=1, max_delay=120)
+        connected = threading.Event()
+        def on_connect(*args):
+            logging.info(f"mqtt connected: {client_id}")
+            connected.set()
+        client.on_connect = on_connect
+        client.on_disconnect = lambda *args: logging.warning(f"mqtt disconnected: {client_id}")
+        client.connect_async(options['server'], options.get('port', 1883), MQTT_KEEPALIVE)
+        client.loop_start()
+        connected.wait(MQTT_CONNECT_TIMEOUT) # runs on a sink worker thread, the event loop is not blocked
+        self.mqtt_clients[device] = (client, None)
+        return client
+
+    def close_mqtt(self, timeout=5):
+        for client, info in self.mqtt_clients.values():
+            if info is not None and client.is_connected():
+                info.wait_for_publish(timeout)
+            client.disconnect()
+            client.loop_stop()
+        self.mqtt_clients = {}
+
+    # Averages each controller's readings into 5 minute statuses and uploads them in bulk, see PVOutput
+    def log_pvoutput_batch(self, batch):
+        if 'pvoutput' in self.stale:
+            self.stale.discard('pvoutput')
+            previous, self.pvoutputs = self.pvoutputs, {}
+            for device, pvoutput in previous.items():
+                if pvoutput is None or self.pvoutput(device) is None: continue
+                pvoutput.close_interval() # keep the statuses not uploaded yet
+                self.pvoutputs[device].backlog.extend(pvoutput.backlog)
+        for reading in batch:
+            pvoutput = self.pvoutput(reading.device)
+            if pvoutput is not None:
+                pvoutput.add(reading.timestamp, reading.data)
+        self.flush_pvoutput()
+
+    # Sends the held statuses, also run on a timer so they don't wait for the next reading
+    def flush_pvoutput(self):
+        for pvoutput in list(self.pvoutputs.values()):
+            if pvoutput is not None: pvoutput.flush()
+
+    # PVOutput of a controller, created on its first reading. A single system_id goes to the
+    # first controller, the others need their own alias:system_id so systems are never mixed.
+    def pvoutput(self, device):
+        if device in self.pvoutputs:
+            return self.pvoutputs[device]
+        options = self.settings.sinks['pvoutput']
+        system_ids = parse_system_ids(options.get('system_id', ''))
+        system_id = system_ids.get(device, system_ids.get(''))
+        if system_id in [pvoutput.system_id for pvoutput in self.pvoutputs.values() if pvoutput is not None]:
+            system_id = None
+        if system_id is None:
+            logging.warning(f"pvoutput: no system_id for {device}, its readings are not uploaded")
+            self.pvoutputs[device] = None
+            return None
+        self.pvoutputs[device] = PVOutput(options['api_key'], system_id, self.http_session(),
+            status_interval=options.get('status_interval', 5) * 60, timeout=options.get('timeout', SINK_TIMEOUT),
+            batch_size=options.get('statuses_per_request', 30))
+        return self.pvoutputs[device]
@@ -0,0 +1,123 @@
+import asyncio
+import configparser
+import logging
+import random
+from .BaseClient import AUTO_ADAPTER
+from .BatteryClient import BatteryClient
+from .DCChargerClient import DCChargerClient
+from .HubClient import HubClient
+from .InverterClient import InverterClient
+from .RoverClient import RoverClient
+from .RoverHistoryClient import RoverHistoryClient
+from .ShuntClient import ShuntClient
+
+# Runs several Renogy devices as tasks on a single event loop.
+# Every section named [device] or [device.<name>] in the config becomes one client,
+# the remaining sections ([data], [mqtt], ...) are shared by all of them.
+# [bluetooth] schedules the devices on the adapters: devices with adapter = auto are spread
+# across the listed adapters, with max_connections set each adapter scans for / connects at most
+# that many devices at a time (established links don't count), and every device starts after a
+# random delay of up to start_jitter seconds.
+
+DEVICE_SECTION = 'device'
+BLUETOOTH_SECTION = 'bluetooth'
+
+CLIENT_TYPES = {
+    'RNG_CTRL': RoverClient,
+    'RNG_CTRL_HIST': RoverHistoryClient,
+    'RNG_BATT': BatteryClient,
+    'RNG_INVT': InverterClient,
+    'RNG_DCC': DCChargerClient,
+    'RNG_SHNT': ShuntClient,
+    'RNG_HUB': HubClient
+}
+
+def device_sections(config):
+    return [name for name in config.sections() if name == DEVICE_SECTION or name.startswith(DEVICE_SECTION + '.')]
+
+# Builds a standalone config for one device, with its section exposed as [device]
+# so that each client keeps reading self.config['device'] as before
+def device_config(config, section):
+    shared = {name: dict(config.items(name, raw=True)) for name in config.sections() if name not in device_sections(config)}
+    shared[DEVICE_SECTION] = dict(config.items(section, raw=True))
+    device_cfg = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    device_cfg.read_dict(shared)
+    return device_cfg
+
+class FleetRunner:
+    def __init__(self, config, on_data_callback=None, on_error_callback=None):
+        self.config: configparser.ConfigParser = config
+        self.on_data_callback = on_data_callback
+        self.on_error_callback = on_error_callback
+        self.clients = []
+
+        for section in device_sections(config):
+            device_type = config[section].get('type')
+            client_class = CLIENT_TYPES.get(device_type)
+            if client_class is None:
+                logging.error(f"[{section}] unknown device type: {device_type}")
+                continue
+            self.clients.append(client_class(device_config(config, section), on_data_callback, on_error_callback))
+
+        self.adapters = [x.strip() for x in config.get(BLUETOOTH_SECTION, 'adapters', fallback='').split(',') if x.strip()]
+        max_connections = config.get(BLUETOOTH_SECTION, 'max_connections', fallback='').strip()
+        self.max_connections = int(max_connections) if max_connections else 0 # 0 = no limit
+        self.start_jitter = config.getfloat(BLUETOOTH_SECTION, 'start_jitter', fallback=0)
+        self.assign_adapters()
+
+        logging.info(f"Init FleetRunner: {len(self.clients)} device(s)")
+
+    # Gives each device with adapter = auto the adapter with the fewest devices so far
+    def assign_adapters(self):
+        load = {adapter: 0 for adapter in self.adapters}
+        auto = []
+        for client in self.clients:
+            if client.config['device'].get('adapter', fallback='').strip() == AUTO_ADAPTER:
+                auto.append(client)
+            elif client.adapter in load:
+                load[client.adapter] += 1
+        for client in auto:
+            if len(load) == 0: break # no adapters listed, use the system default
+            client.adapter = min(load, key=load.get)
+            load[client.adapter] += 1
+            logging.info(f"{client.alias} => {client.adapter}")
+
+    def start(self):
+        loop = asyncio.get_event_loop()
+        try:
+            loop.run_until_complete(self.run())
+        except KeyboardInterrupt:
+            logging.info("KeyboardInterrupt, stopping all devices")
+            for client in self.clients:
+                if client.loop: client.stop()
+            pending = [client.future for client in self.clients if client.future and not client.future.done()]
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    async def run(self):
+        if not self.clients:
+            return logging.error("No devices to run, please check the config file")
+        slots = {}
+        for client in self.clients:
+            if self.max_connections <= 0: break
+            if client.adapter not in slots:
+                slots[client.adapter] = asyncio.Semaphore(self.max_connections)
+            client.connection_slot = slots[client.adapter]
+        await asyncio.gather(*[self.__run_client(client) for client in self.clients])
+
+    # Applies reloaded settings to every client without reconnecting
+    def reload(self, settings):
+        for client in self.clients:
+            client.apply_settings(settings)
+        logging.info(f"FleetRunner: settings reloaded for {len(self.clients)} device(s)")
+
+    # each client owns its retry/backoff state, a failing device only ends its own task
+    async def __run_client(self, client):
+        try:
+            if self.start_jitter > 0:
+                await asyncio.sleep(random.uniform(0, self.start_jitter))
+            await client.run()
+        except Exception as e:
+            logging.error(f"{client.alias} stopped with exception: {e}")
+            if self.on_error_callback is not None:
+                self.on_error_callback(client, e)
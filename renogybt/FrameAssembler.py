@@ -0,0 +1,65 @@
+import logging
+from .Utils import crc16_modbus
+
+# Reassembles Modbus RTU frames from BLE notifications.
+# A response may be split across several notifications, or several responses may arrive
+# in one. Frames are handed out as memoryviews, only once complete and CRC verified.
+# Frames dropped for a bad CRC are kept in rejected until the next feed, their length
+# tells which request they answered.
+
+READ_FUNCTIONS = (3, 4)
+WRITE_FUNCTIONS = (6, 16)
+EXCEPTION_FLAG = 0x80
+
+class FrameAssembler:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+        self.rejected = []
+
+    def reset(self):
+        self.buffer.clear()
+
+    def feed(self, data):
+        self.rejected = []
+        if len(self.buffer) == 0:
+            view = memoryview(data) # common case of one whole frame per notification, no copy
+        else:
+            self.buffer += data
+            view = memoryview(bytes(self.buffer))
+            self.buffer.clear()
+
+        frames = []
+        pos = 0
+        while pos < len(view):
+            length = self.frame_length(view[pos:])
+            if length is None or pos + length > len(view):
+                break # wait for the rest of the frame
+            if length == 0:
+                pos += 1 # not a frame start, resync on the next byte
+                continue
+            frame = view[pos:pos + length]
+            if crc16_modbus(frame[:-2]) == frame[-2:]:
+                frames.append(frame)
+            else:
+                self.crc_errors += 1
+                self.rejected.append(bytes(frame))
+                logging.warning(f"FrameAssembler: crc mismatch, dropping frame {frame.hex()}")
+            pos += length
+
+        self.buffer += view[pos:]
+        return frames
+
+    # Total length of the frame starting at bs[0], None if more bytes are needed to tell,
+    # 0 if bs[0] cannot start a known frame
+    @staticmethod
+    def frame_length(bs):
+        if len(bs) < 2: return None
+        function = bs[1]
+        if function & EXCEPTION_FLAG:
+            return 5 # id, function, exception code, crc
+        if function in READ_FUNCTIONS:
+            return bs[2] + 5 if len(bs) >= 3 else None # id, function, byte count, data, crc
+        if function in WRITE_FUNCTIONS:
+            return 8 # id, function, register, value, crc
+        return 0
@@ -0,0 +1,81 @@
+import configparser
+import logging
+from .BaseClient import BaseClient
+from .BatteryClient import BatteryClient
+from .DCChargerClient import DCChargerClient
+from .InverterClient import InverterClient
+from .RoverClient import RoverClient
+
+# Polls several Modbus slaves (hub mode or daisy chain) over one BLE connection.
+# [device] slaves = 48:RNG_BATT, 49:RNG_BATT, 97:RNG_CTRL lists the device ids behind the module.
+# Each slave gets its own client with its own parsers and data, and all their sections are read
+# in one serialized request queue with the slave's device_id. At the end of every cycle each
+# slave's reading is emitted with the slave client, as alias-<device_id>.
+
+SLAVE_TYPES = {
+    'RNG_CTRL': RoverClient,
+    'RNG_BATT': BatteryClient,
+    'RNG_INVT': InverterClient,
+    'RNG_DCC': DCChargerClient
+}
+
+# Parses "48:RNG_BATT, 97:RNG_CTRL" into [(48, 'RNG_BATT'), (97, 'RNG_CTRL')]
+def parse_slaves(slaves_str):
+    slaves = []
+    for item in [x.strip() for x in slaves_str.split(',') if x.strip()]:
+        device_id, device_type = [x.strip() for x in item.split(':', 1)]
+        slaves.append((int(device_id), device_type))
+    return slaves
+
+# Config of one slave: the hub's config with the slave's device_id, type and alias
+def slave_config(config, device_id, device_type):
+    sections = {name: dict(config.items(name, raw=True)) for name in config.sections()}
+    sections['device'].update({'device_id': str(device_id), 'type': device_type, 'alias': f"{config['device']['alias']}-{device_id}"})
+    cfg = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    cfg.read_dict(sections)
+    return cfg
+
+class HubClient(BaseClient):
+    def __init__(self, config, on_data_callback=None, on_error_callback=None):
+        super().__init__(config)
+        self.on_data_callback = on_data_callback
+        self.on_error_callback = on_error_callback
+        self.data = {}
+        self.stopped = False
+        self.slaves = []
+        for device_id, device_type in parse_slaves(self.config['device'].get('slaves', fallback='')):
+            client_class = SLAVE_TYPES.get(device_type)
+            if client_class is None:
+                logging.error(f"HubClient: unsupported slave type {device_type} for device_id {device_id}")
+                continue
+            slave = client_class(slave_config(self.config, device_id, device_type), on_data_callback, on_error_callback)
+            slave.parent = self
+            self.slaves.append(slave)
+            self.sections.extend(dict(section, device_id=device_id) for section in slave.sections)
+        if len(self.slaves) > 0:
+            self.device_id = self.slaves[0].device_id
+            self.pipeline_window = min([self.pipeline_window] + [slave.max_pipeline_window for slave in self.slaves])
+
+    async def connect(self):
+        if len(self.slaves) == 0:
+            logging.error(f"HubClient: {self.alias} has no supported slaves, please check [device] slaves")
+            return self.stop()
+        await super().connect()
+
+    # Every slave forwards its stop() here, the shared connection is only closed once
+    def stop(self):
+        if self.stopped: return
+        self.stopped = True
+        super().stop()
+
+    def apply_settings(self, settings):
+        super().apply_settings(settings)
+        for slave in self.slaves: slave.apply_settings(settings)
+
+    def on_read_operation_complete(self):
+        for slave in self.slaves:
+            slave.ble_manager = self.ble_manager
+            slave.cycle_started = self.cycle_started
+            if len(slave.data) > 0:
+                slave.on_read_operation_complete()
+            slave.data = {}
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters and histograms of the polling and logging path, in Prometheus text format.
+# Metrics are always collected (a dict update per event), serve() exposes them on
+# http://<host>:<port>/metrics for scraping.
+#
+#   REQUEST_SECONDS.observe(0.12, device='BT-TH-B00FXXXX')
+#   with DISCOVERY_SECONDS.time(device='BT-TH-B00FXXXX'): ...
+
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # (seconds)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if len(pairs) == 0: return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+        self.values = {} # sorted label items => value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self.lock:
+            return [f'{self.name}{format_labels(key)} {value}' for key, value in self.values.items()]
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, description, buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.values = {} # sorted label items => [count per bucket..., count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += 1
+            counts[-1] += value
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def count(self, **labels):
+        counts = self.values.get(tuple(sorted(labels.items())))
+        return counts[-2] if counts else 0
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, counts in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{format_labels(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_bucket{format_labels(key, [("le", "+Inf")])} {counts[-2]}')
+                lines.append(f'{self.name}_sum{format_labels(key)} {round(counts[-1], 6)}')
+                lines.append(f'{self.name}_count{format_labels(key)} {counts[-2]}')
+        return lines
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.server = None
+
+    def counter(self, name, description):
+        return self.register(Counter(name, description))
+
+    def histogram(self, name, description, buckets=BUCKETS):
+        return self.register(Histogram(name, description, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += [f'# HELP {metric.name} {metric.description}', f'# TYPE {metric.name} {metric.type}'] + metric.samples()
+        return '\n'.join(lines) + '\n'
+
+    # Serves /metrics from a daemon thread
+    def serve(self, port, host=''):
+        registry = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    return self.send_error(404)
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Metrics available on http://{host or '0.0.0.0'}:{self.server.server_address[1]}/metrics")
+        return self.server
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+REGISTRY = Registry()
+
+DISCOVERY_SECONDS = REGISTRY.histogram('renogybt_discovery_seconds', 'Time to find a device, by result (cache, found, not_found)')
+CONNECT_SECONDS = REGISTRY.histogram('renogybt_connect_seconds', 'Time to connect and subscribe to a device')
+CONNECT_FAILURES = REGISTRY.counter('renogybt_connect_failures_total', 'Failed connection attempts')
+DISCONNECTS = REGISTRY.counter('renogybt_disconnects_total', 'Unexpected disconnects')
+REQUEST_SECONDS = REGISTRY.histogram('renogybt_request_seconds', 'Round trip of a read request, by first register')
+READ_TIMEOUTS = REGISTRY.counter('renogybt_read_timeouts_total', 'Read requests that timed out')
+READ_FAILURES = REGISTRY.counter('renogybt_read_failures_total', 'Failed reads, by reason (crc, error, length)')
+RETRIES = REGISTRY.counter('renogybt_retries_total', 'Reconnect attempts after a failure')
+READINGS = REGISTRY.counter('renogybt_readings_total', 'Completed readings')
+SINK_SECONDS = REGISTRY.histogram('renogybt_sink_seconds', 'Time to deliver a batch of readings')
+SINK_FAILURES = REGISTRY.counter('renogybt_sink_failures_total', 'Failed or timed out deliveries')
+SINK_DROPPED = REGISTRY.counter('renogybt_sink_dropped_total', 'Readings dropped from a full queue')
@@ -0,0 +1,116 @@
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+# Uploads charge controller readings to PVOutput in batches.
+# Readings are averaged into one status per status_interval (energy totals take the last value).
+# A status is stamped with the time of its last reading, and intervals also end at local midnight,
+# so energy never lands on the next day and a status is never in the future. Finished statuses
+# are kept in a backlog and sent up to batch_size at a time through
+# addbatchstatus.jsp. Requests are spaced at least min_request_interval apart and held
+# while the rate limit reported in the X-Rate-Limit-* response headers is used up.
+# One PVOutput averages the readings of one controller, see parse_system_ids.
+
+BATCH_URL = 'https://pvoutput.org/service/r2/addbatchstatus.jsp'
+STATUS_INTERVAL = 300 # (seconds)
+BATCH_SIZE = 30 # max statuses per request for free accounts (100 with donation)
+MIN_REQUEST_INTERVAL = 60 # (seconds)
+MAX_BACKLOG = 14 * 24 * 12 # PVOutput only accepts batch statuses up to 14 days old
+AVERAGED = {'v2': 'pv_power', 'v4': 'load_power', 'v5': 'controller_temperature', 'v6': 'battery_voltage'}
+LAST = {'v1': 'power_generation_today', 'v3': 'power_consumption_today'}
+PARAMETERS = ['v1', 'v2', 'v3', 'v4', 'v5', 'v6']
+
+# "12345" for a single controller, or "alias:12345, alias:67890" to upload several
+# controllers to their own systems, as {alias: system id} ('' for the single system)
+def parse_system_ids(value):
+    system_ids = {}
+    for item in [x.strip() for x in value.split(',') if x.strip()]:
+        alias, _, system_id = item.rpartition(':')
+        system_ids[alias.strip()] = system_id.strip()
+    return system_ids
+
+def local_date(timestamp):
+    return datetime.fromtimestamp(timestamp).date()
+
+class PVOutput:
+    def __init__(self, api_key, system_id, session, status_interval=STATUS_INTERVAL, batch_size=BATCH_SIZE, min_request_interval=MIN_REQUEST_INTERVAL, timeout=15):
+        self.headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "X-Pvoutput-Apikey": api_key,
+            "X-Pvoutput-SystemId": system_id,
+            "X-Rate-Limit": "1"
+        }
+        self.system_id = system_id
+        self.session = session
+        self.status_interval = status_interval
+        self.batch_size = batch_size
+        self.min_request_interval = min_request_interval
+        self.timeout = timeout
+        self.bucket = None # start of the interval being averaged
+        self.last_reading = None # timestamp of the interval's last reading
+        self.values = {} # parameter => [sum, count] or last value
+        self.backlog = deque(maxlen=MAX_BACKLOG) # (timestamp, {parameter: value})
+        self.next_request = 0
+        self.rate_limit = None # (remaining, limit, reset timestamp) from the last response
+
+    # Adds a reading taken at timestamp, closing the current interval when it moves on
+    def add(self, timestamp, data):
+        bucket = int(timestamp // self.status_interval) * self.status_interval
+        if self.bucket is not None and (bucket != self.bucket or local_date(timestamp) != local_date(self.last_reading)):
+            self.close_interval() # also at local midnight, where the daily totals reset
+        self.bucket = bucket
+        self.last_reading = timestamp
+        for parameter, field in AVERAGED.items():
+            if field in data:
+                total = self.values.setdefault(parameter, [0, 0])
+                total[0] += data[field]
+                total[1] += 1
+        for parameter, field in LAST.items():
+            if field in data:
+                self.values[parameter] = data[field]
+
+    def close_interval(self):
+        if self.bucket is None or len(self.values) == 0: return
+        status = {parameter: round(value[0] / value[1], 2) if isinstance(value, list) else value for parameter, value in self.values.items()}
+        self.backlog.append((self.last_reading, status))
+        self.bucket = None
+        self.values = {}
+
+    # Sends one batch from the backlog if the request spacing and rate limit allow
+    def flush(self, now=None):
+        now = now if now is not None else time.time()
+        if len(self.backlog) == 0 or now < self.next_request or self.__rate_limited(now):
+            return
+        batch = [self.backlog[i] for i in range(min(self.batch_size, len(self.backlog)))]
+        self.next_request = now + self.min_request_interval
+        response = self.session.post(BATCH_URL, data={'data': ';'.join(self.__format(*status) for status in batch)}, headers=self.headers, timeout=self.timeout)
+        self.__update_rate_limit(response)
+        if response.status_code == 200:
+            for _ in batch: self.backlog.popleft()
+            logging.info(f"pvoutput: uploaded {len(batch)} statuses, {len(self.backlog)} waiting")
+        elif response.status_code == 400: # rejected data will not be accepted on retry either
+            for _ in batch: self.backlog.popleft()
+            logging.error(f"pvoutput: {len(batch)} statuses rejected: {response.text}")
+        else:
+            logging.warning(f"pvoutput: upload failed {response.status_code} {response.text}, {len(self.backlog)} statuses held")
+
+    def __rate_limited(self, now):
+        if self.rate_limit is None: return False
+        remaining, limit, reset = self.rate_limit
+        return remaining <= 0 and now < reset
+
+    def __update_rate_limit(self, response):
+        try:
+            self.rate_limit = (int(response.headers['X-Rate-Limit-Remaining']), int(response.headers['X-Rate-Limit-Limit']), int(response.headers['X-Rate-Limit-Reset']))
+        except (KeyError, ValueError):
+            if response.status_code == 403 and 'Exceeded' in response.text:
+                self.rate_limit = (0, 0, time.time() + 3600)
+            return
+        if self.rate_limit[0] <= 0:
+            logging.warning(f"pvoutput: rate limit of {self.rate_limit[1]} requests reached, holding uploads until {datetime.fromtimestamp(self.rate_limit[2]):%H:%M}")
+
+    # Batch status format: date,time,v1,v2,v3,v4,v5,v6 with -1 for missing values
+    def __format(self, timestamp, status):
+        date_time = datetime.fromtimestamp(timestamp).strftime("%Y%m%d,%H:%M")
+        return ','.join([date_time] + [str(status.get(parameter, -1)) for parameter in PARAMETERS])
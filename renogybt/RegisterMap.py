@@ -0,0 +1,121 @@
+import struct
+from operator import itemgetter
+
+# Declarative description of the fields in a register section.
+# Offsets are byte positions in the response frame (3 is the first data byte).
+# A RegisterMap is compiled once into a RegisterDecoder that unpacks a whole section with a
+# single struct call, then applies the precomputed scaling / enum / unit conversions.
+#
+# Example:
+#   CHARGING_INFO = RegisterMap(
+#       Field('battery_voltage', 5, scale=0.1, unit='V'),
+#       Field('battery_temperature', 10, 1, signed=SIGN_MAGNITUDE, unit='C'),
+#   )
+
+SIGN_MAGNITUDE = 'sign_magnitude' # bit 7 is the sign, bits 0-6 the value (8 bit temperatures)
+TEMPERATURE_UNIT = 'C' # fields with this unit are converted to the configured temperature unit
+
+INT_CODES = {1: 'B', 2: 'H', 4: 'I'}
+
+class Field:
+    def __init__(self, name, offset, width=2, signed=False, scale=1, enum=None, unit=None, shift=0, text=False, count=1, count_field=None):
+        self.name = name
+        self.offset = offset
+        self.width = width
+        self.signed = signed
+        self.scale = scale
+        self.enum = enum
+        self.unit = unit
+        self.shift = shift # right shift applied to the raw value, e.g. 7 to read the top bit of a byte
+        self.text = text # utf-8 string padded with spaces or nulls
+        self.count = count # repeated field, decoded as name_0 .. name_{count-1}
+        self.count_field = count_field # field holding how many of the repeated values are valid
+
+    def format(self):
+        if self.text or self.width not in INT_CODES:
+            return f'{self.width}s'
+        code = INT_CODES[self.width]
+        return code.lower() if self.signed is True else code
+
+    # Builds the conversion applied to the unpacked value, None when the value is used as is
+    def converter(self, temperature_unit):
+        steps = []
+        if self.text:
+            steps.append(lambda v: v.decode('utf-8').rstrip('\x00').strip())
+        elif self.width not in INT_CODES:
+            signed = self.signed is True
+            steps.append(lambda v: int.from_bytes(v, 'big', signed=signed))
+        if self.shift:
+            shift = self.shift
+            steps.append(lambda v: v >> shift)
+        if self.signed == SIGN_MAGNITUDE:
+            steps.append(lambda v: -(v - 128) if v >> 7 == 1 else v)
+        if self.scale != 1:
+            scale = self.scale
+            steps.append(lambda v: round(v * scale, 2))
+        if self.enum is not None:
+            steps.append(self.enum.get)
+        if self.unit == TEMPERATURE_UNIT and temperature_unit == 'F':
+            steps.append(lambda v: (v * 9/5) + 32)
+
+        if len(steps) == 0: return None
+        if len(steps) == 1: return steps[0]
+        def convert(v):
+            for step in steps: v = step(v)
+            return v
+        return convert
+
+class RegisterMap:
+    def __init__(self, *fields):
+        self.fields = fields
+
+    def compile(self, temperature_unit = 'F'):
+        return RegisterDecoder(self, temperature_unit.strip())
+
+    # (name, byte offset, field) of every decoded value, in declaration order
+    def slots(self):
+        for field in self.fields:
+            for i in range(field.count):
+                name = field.name if field.count == 1 else f'{field.name}_{i}'
+                yield name, field.offset + i * field.width, field
+
+class RegisterDecoder:
+    def __init__(self, register_map, temperature_unit):
+        slots = list(register_map.slots())
+        by_offset = sorted(range(len(slots)), key=lambda i: slots[i][1])
+
+        fmt = '>'
+        position = 0
+        for i in by_offset:
+            name, offset, field = slots[i]
+            if offset < position:
+                raise ValueError(f"RegisterMap field {name} overlaps the previous field")
+            fmt += 'x' * (offset - position) + field.format()
+            position = offset + field.width
+
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.names = tuple(name for name, _, _ in slots)
+        # unpacked values come in offset order, this puts them back in declaration order
+        unpacked_index = {slot: index for index, slot in enumerate(by_offset)}
+        getter = itemgetter(*[unpacked_index[i] for i in range(len(slots))])
+        self.reorder = getter if len(slots) > 1 else lambda values: (getter(values),)
+        self.converters = tuple(field.converter(temperature_unit) for _, _, field in slots)
+        self.needs_conversion = any(c is not None for c in self.converters)
+        self.counted = [(field.name, field.count, field.count_field) for field in register_map.fields if field.count_field]
+
+    def decode_into(self, bs, data):
+        if len(bs) < self.size:
+            bs = bytes(bs).ljust(self.size, b'\x00')
+        values = self.reorder(self.struct.unpack_from(bs))
+        if self.needs_conversion:
+            values = [v if c is None else c(v) for c, v in zip(self.converters, values)]
+        data.update(zip(self.names, values))
+
+        for name, count, count_field in self.counted:
+            for i in range(max(data.get(count_field, 0), 0), count):
+                del data[f'{name}_{i}']
+        return data
+
+    def decode(self, bs):
+        return self.decode_into(bs, {})
@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import logging
+from types import SimpleNamespace
+from .Capture import CONNECTED, DISCONNECTED, LOST, NOTIFY, WRITE, read_capture
+
+# Stand-in for BLEManager that plays a capture (see Capture.py) back to the clients.
+# Each recorded write waits for the client to write, the notifications that followed it are
+# delivered at their original offset from that write, divided by speed (0 = as fast as possible).
+# Recorded disconnects are replayed too, so field issues can be reproduced and the parsers and
+# pipeline benchmarked on real traffic.
+#
+#   replay = Replay('renogy.cap', speed=0)
+#   client = RoverClient(config, on_data, on_error)
+#   replay.attach(client)
+#   client.start()
+
+class Replay:
+    def __init__(self, path, speed=1.0):
+        self.tracks = read_capture(path)
+        self.speed = speed
+        self.positions = {} # alias => index of the next event to play
+
+    def attach(self, client):
+        client.ble_manager_class = functools.partial(ReplayBLEManager, self)
+
+    def find(self, mac_address, alias):
+        track = self.tracks.get(alias)
+        if track is None:
+            track = next((t for t in self.tracks.values() if t.mac_addr.upper() == mac_address.upper()), None)
+        return track
+
+class ReplayBLEManager:
+    def __init__(self, replay, mac_address, alias, on_data, on_connect_fail, on_disconnect, **kwargs):
+        self.replay = replay
+        self.mac_address = mac_address
+        self.device_alias = alias
+        self.data_callback = on_data
+        self.connect_fail_callback = on_connect_fail
+        self.disconnect_callback = on_disconnect
+        self.track = None
+        self.device = None
+        self.client = None
+        self.discovered_devices = []
+        self.writes = None
+        self.play_task = None
+
+    async def discover(self):
+        self.track = self.replay.find(self.mac_address, self.device_alias)
+        if self.track:
+            self.device = SimpleNamespace(name=self.track.alias, address=self.track.mac_addr)
+            self.discovered_devices = [self.device]
+
+    async def connect(self):
+        if not self.device: return logging.error("No device connected!")
+        events = self.track.events
+        position = self.replay.positions.get(self.track.alias, 0)
+        while position < len(events) and events[position].kind != CONNECTED:
+            position += 1
+        if position == len(events):
+            return self.connect_fail_callback(ConnectionError(f"End of capture for {self.track.alias}"))
+        self.replay.positions[self.track.alias] = position + 1
+        self.client = SimpleNamespace(is_connected=True, address=self.device.address)
+        self.writes = asyncio.Queue()
+        self.play_task = asyncio.get_running_loop().create_task(self.__play(events[position].time))
+
+    async def characteristic_write_value(self, data):
+        if not self.client or not self.client.is_connected:
+            return logging.info('characteristic_write_value failed: not connected')
+        self.writes.put_nowait(bytes(data))
+
+    async def disconnect(self):
+        if self.play_task: self.play_task.cancel()
+        if self.client: self.client.is_connected = False
+
+    async def __play(self, started):
+        loop = asyncio.get_running_loop()
+        anchor = (started, loop.time()) # recorded time => replay time of the last connect or write
+        events = self.track.events
+        while self.client.is_connected:
+            position = self.replay.positions[self.track.alias]
+            if position == len(events):
+                return logging.info(f"Replay of {self.track.alias} finished")
+            event = events[position]
+            if event.kind == WRITE:
+                request = await self.writes.get()
+                if request != event.data:
+                    logging.debug(f"Replay: request {request.hex()} differs from the recorded {event.data.hex()}")
+                anchor = (event.time, loop.time())
+            elif event.kind == NOTIFY:
+                if self.replay.speed > 0:
+                    await asyncio.sleep(max(0, anchor[1] + (event.time - anchor[0]) / self.replay.speed - loop.time()))
+                else:
+                    await asyncio.sleep(0)
+                loop.create_task(self.data_callback(bytearray(event.data)))
+            elif event.kind in (DISCONNECTED, LOST, CONNECTED):
+                self.replay.positions[self.track.alias] = position + (event.kind != CONNECTED)
+                if event.kind == LOST:
+                    self.client.is_connected = False
+                    self.disconnect_callback()
+                return
+            self.replay.positions[self.track.alias] = position + 1
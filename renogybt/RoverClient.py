@@ -1,7 +1,8 @@
 import asyncio
 import logging
-from .BaseClient import BaseClient
-from .Utils import bytes_to_int, parse_temperature
+from .BaseClient import BaseClient, ONCE_PER_CONNECTION, Refresh
+from .RegisterMap import Field, RegisterMap, SIGN_MAGNITUDE
+from .Utils import bytes_to_int
 
 # Read and parse BT-1/BT-2 type bluetooth modules connected to Renogy Rover/Wanderer/Adventurer
 
@@ -33,21 +34,61 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+DEVICE_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('model', 3, 16, text=True)
+)
+
+DEVICE_ADDRESS = RegisterMap(
+    Field('device_id', 4, 1)
+)
+
+CHARGING_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_percentage', 3, unit='%'),
+    Field('battery_voltage', 5, scale=0.1, unit='V'),
+    Field('battery_current', 7, scale=0.01, unit='A'),
+    Field('battery_temperature', 10, 1, signed=SIGN_MAGNITUDE, unit='C'),
+    Field('controller_temperature', 9, 1, signed=SIGN_MAGNITUDE, unit='C'),
+    Field('load_status', 67, 1, shift=7, enum=LOAD_STATE),
+    Field('load_voltage', 11, scale=0.1, unit='V'),
+    Field('load_current', 13, scale=0.01, unit='A'),
+    Field('load_power', 15, unit='W'),
+    Field('pv_voltage', 17, scale=0.1, unit='V'),
+    Field('pv_current', 19, scale=0.01, unit='A'),
+    Field('pv_power', 21, unit='W'),
+    Field('max_charging_power_today', 33, unit='W'),
+    Field('max_discharging_power_today', 35, unit='W'),
+    Field('charging_amp_hours_today', 37, unit='Ah'),
+    Field('discharging_amp_hours_today', 39, unit='Ah'),
+    Field('power_generation_today', 41, unit='Wh'),
+    Field('power_consumption_today', 43, unit='Wh'),
+    Field('power_generation_total', 59, 4, unit='Wh'),
+    Field('charging_status', 68, 1, enum=CHARGING_STATE)
+)
+
+BATTERY_TYPE_INFO = RegisterMap(
+    Field('function', 1, 1, enum=FUNCTION),
+    Field('battery_type', 3, enum=BATTERY_TYPE)
+)
+
 class RoverClient(BaseClient):
+    max_pipeline_window = 2 # BT-1 modules buffer little
+
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
         self.on_data_callback = on_data_callback
         self.on_error_callback = on_error_callback
         self.data = {}
         self.sections = [
-            {'register': 12, 'words': 8, 'parser': self.parse_device_info},
-            {'register': 26, 'words': 1, 'parser': self.parse_device_address},
+            {'register': 12, 'words': 8, 'parser': self.parse_device_info, 'refresh': ONCE_PER_CONNECTION},
+            {'register': 26, 'words': 1, 'parser': self.parse_device_address, 'refresh': ONCE_PER_CONNECTION},
             {'register': 256, 'words': 34, 'parser': self.parse_chargin_info},
-            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type}
+            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type, 'refresh': Refresh(seconds=300)}
         ]
         self.set_load_params = {'function': 6, 'register': 266}
 
-    async def on_data_received(self, response):
+    async def on_frame_received(self, response):
         operation = bytes_to_int(response, 1, 1)
         if operation == 6: # write operation
             self.parse_set_load_response(response)
@@ -55,7 +96,7 @@ class RoverClient(BaseClient):
             self.data = {}
         else:
             # read is handled in base class
-            await super().on_data_received(response)
+            await super().on_frame_received(response)
 
     def on_write_operation_complete(self):
         logging.info("on_write_operation_complete")
@@ -68,47 +109,16 @@ class RoverClient(BaseClient):
         asyncio.create_task(self.ble_manager.characteristic_write_value(request))
 
     def parse_device_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['model'] = (bs[3:19]).decode('utf-8').strip()
-        self.data.update(data)
+        self.decode_section(DEVICE_INFO, bs)
 
     def parse_device_address(self, bs):
-        data = {}
-        data['device_id'] = bytes_to_int(bs, 4, 1)
-        self.data.update(data)
+        self.decode_section(DEVICE_ADDRESS, bs)
 
     def parse_chargin_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_percentage'] = bytes_to_int(bs, 3, 2)
-        data['battery_voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['battery_current'] = bytes_to_int(bs, 7, 2, scale = 0.01)
-        data['battery_temperature'] = parse_temperature(bytes_to_int(bs, 10, 1), temp_unit)
-        data['controller_temperature'] = parse_temperature(bytes_to_int(bs, 9, 1), temp_unit)
-        data['load_status'] = LOAD_STATE.get(bytes_to_int(bs, 67, 1) >> 7)
-        data['load_voltage'] = bytes_to_int(bs, 11, 2, scale = 0.1)
-        data['load_current'] = bytes_to_int(bs, 13, 2, scale = 0.01)
-        data['load_power'] = bytes_to_int(bs, 15, 2)
-        data['pv_voltage'] = bytes_to_int(bs, 17, 2, scale = 0.1) 
-        data['pv_current'] = bytes_to_int(bs, 19, 2, scale = 0.01)
-        data['pv_power'] = bytes_to_int(bs, 21, 2)
-        data['max_charging_power_today'] = bytes_to_int(bs, 33, 2)
-        data['max_discharging_power_today'] = bytes_to_int(bs, 35, 2)
-        data['charging_amp_hours_today'] = bytes_to_int(bs, 37, 2)
-        data['discharging_amp_hours_today'] = bytes_to_int(bs, 39, 2)
-        data['power_generation_today'] = bytes_to_int(bs, 41, 2)
-        data['power_consumption_today'] = bytes_to_int(bs, 43, 2)
-        data['power_generation_total'] = bytes_to_int(bs, 59, 4)
-        data['charging_status'] = CHARGING_STATE.get(bytes_to_int(bs, 68, 1))
-        self.data.update(data)
+        self.decode_section(CHARGING_INFO, bs)
 
     def parse_battery_type(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_type'] = BATTERY_TYPE.get(bytes_to_int(bs, 3, 2))
-        self.data.update(data)
+        self.decode_section(BATTERY_TYPE_INFO, bs)
 
     def parse_set_load_response(self, bs):
         data = {}
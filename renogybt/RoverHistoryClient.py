@@ -1,30 +1,97 @@
+import json
+import logging
+import os
+from datetime import date, timedelta
 from .BaseClient import BaseClient
 from .Utils import bytes_to_int
 
-# Retrieve last 7 days of historical data from Rover/Wanderer/Adventurer
+# Retrieve daily historical data from Rover/Wanderer/Adventurer
+# Register 61440 + n holds the record of n days ago (61440 is today). The number of days read
+# is the controller's total working days, capped by history_days. With history_cursor set, the
+# last fully synced day is stored in that file and later runs only read the days after it.
+# A day whose read failed holds the cursor back, so it is read again on the next sync.
+# Each day is a separate page of 10 words, so day registers can not be merged into one read.
+
+HISTORY_REGISTER = 61440
+WORKING_DAYS_REGISTER = 277
+MAX_HISTORY_DAYS = 256
+HISTORY_DAYS = 7
 
 class RoverHistoryClient(BaseClient):
+    max_pipeline_window = 2 # BT-1 modules buffer little
+
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
         self.on_data_callback = on_data_callback
         self.on_error_callback = on_error_callback
+        self.history_days = min(self.config['device'].getint('history_days', fallback=HISTORY_DAYS), MAX_HISTORY_DAYS)
+        self.cursor_file = self.config['device'].get('history_cursor', fallback='')
+        self.reset_data()
+        self.sections = [
+            {'register': WORKING_DAYS_REGISTER, 'words': 1, 'parser': self.parse_working_days}
+        ]
+
+    def reset_data(self):
+        self.planned_days = [] # dates read this cycle, oldest first
         self.data = {
             'function': 'READ',
+            'daily_date': [],
             'daily_power_generation': [],
             'daily_charge_ah': [],
             'daily_max_power': []
         }
-        self.sections = [
-            {'register': 61446, 'words': 10, 'parser': self.parse_historical_data},
-            {'register': 61445, 'words': 10, 'parser': self.parse_historical_data},
-            {'register': 61444, 'words': 10, 'parser': self.parse_historical_data},
-            {'register': 61443, 'words': 10, 'parser': self.parse_historical_data},
-            {'register': 61442, 'words': 10, 'parser': self.parse_historical_data},
-            {'register': 61441, 'words': 10, 'parser': self.parse_historical_data},
-            {'register': 61440, 'words': 10, 'parser': self.parse_historical_data}
+
+    # Plans one read per day still to sync, oldest first
+    def parse_working_days(self, bs):
+        self.reset_data()
+        self.today = date.today()
+        self.data['total_working_days'] = bytes_to_int(bs, 3, 2)
+        days = min(self.data['total_working_days'], self.history_days)
+        last_synced = self.load_cursor()
+        if last_synced is not None:
+            days = min(days, (self.today - last_synced).days)
+        logging.info(f"RoverHistoryClient: reading {days} days of history")
+        self.planned_days = [self.today - timedelta(days=n) for n in reversed(range(days))]
+        self.read_plan = self.read_plan[:1] + [
+            {'register': HISTORY_REGISTER + n, 'words': 10, 'parser': self.parse_historical_data} for n in reversed(range(days))
         ]
 
     def parse_historical_data(self, bs):
+        days_ago = self.read_plan[self.section_index]['register'] - HISTORY_REGISTER
+        self.data['daily_date'].append((self.today - timedelta(days=days_ago)).isoformat())
         self.data['daily_power_generation'].append(bytes_to_int(bs, 19, 2))
         self.data['daily_charge_ah'].append(bytes_to_int(bs, 15, 2))
         self.data['daily_max_power'].append(bytes_to_int(bs, 11, 2))
+
+    async def read_section(self):
+        if self.section_index == 0:
+            self.reset_data() # also reported as is when the working days read fails
+        await super().read_section()
+
+    def on_read_operation_complete(self):
+        read = set(self.data['daily_date'])
+        missing = [day for day in self.planned_days if day.isoformat() not in read]
+        if missing:
+            logging.warning(f"RoverHistoryClient: {len(missing)} day(s) could not be read, retrying them on the next sync")
+        if len(read) > 0:
+            # today is still in progress, read it again next time
+            last_synced = (missing[0] if missing else self.today) - timedelta(days=1)
+            previous = self.load_cursor()
+            if previous is None or last_synced > previous:
+                self.save_cursor(last_synced)
+        super().on_read_operation_complete()
+
+    def load_cursor(self):
+        if not self.cursor_file: return None
+        try:
+            with open(self.cursor_file) as f:
+                return date.fromisoformat(json.load(f)['last_synced'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save_cursor(self, last_synced):
+        if not self.cursor_file: return
+        tmp = self.cursor_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'last_synced': last_synced.isoformat()}, f)
+        os.replace(tmp, self.cursor_file)
@@ -0,0 +1,80 @@
+import logging
+from .ChangeFilter import HEARTBEAT, parse_deadbands
+
+# Typed view of the shared config sections, parsed and validated once instead of on every reading.
+# Clients and the DataLogger read their [data] and sink options from here, and a new Settings
+# can be applied while running (e.g. on SIGHUP) without dropping the bluetooth connections.
+# [device] sections are not part of it, changing them still needs a restart.
+#
+#   settings = Settings(config)
+#   data = settings.project(data)
+
+TEMPERATURE_UNITS = ('F', 'C')
+QUEUE_POLICIES = ('drop_oldest', 'overflow')
+SINK_SECTIONS = ('remote_logging', 'mqtt', 'pvoutput', 'local_store')
+# sink option => type, the other options are kept as strings
+SINK_OPTION_TYPES = {
+    'enabled': bool, 'batch_size': int, 'batch_window': float, 'timeout': float, 'compress': bool, 'port': int,
+    'qos': int, 'max_inflight': int, 'status_interval': int, 'statuses_per_request': int, 'retention_days': float
+}
+
+class Settings:
+    def __init__(self, config):
+        data = config['data'] if config.has_section('data') else config[config.default_section]
+        self.enable_polling = data.getboolean('enable_polling', fallback=False)
+        self.poll_interval = data.getint('poll_interval', fallback=60)
+        self.temperature_unit = data.get('temperature_unit', fallback='F').strip().upper()
+        self.fields = tuple(x.strip() for x in data.get('fields', fallback='').split(',') if x.strip())
+        self.field_set = frozenset(self.fields)
+        self.queue_size = data.getint('queue_size', fallback=100)
+        self.queue_policy = data.get('queue_policy', fallback='drop_oldest').strip()
+        self.spool_dir = data.get('spool_dir', fallback='').strip()
+        self.spool_max_size = data.getfloat('spool_max_size', fallback=50) * 1024 * 1024
+        self.change_only = data.getboolean('change_only', fallback=False)
+        self.deadbands = parse_deadbands(data.get('deadband', fallback=''))
+        self.heartbeat = data.getfloat('heartbeat', fallback=HEARTBEAT)
+        self.sinks = {section: self.__sink(config, section) for section in SINK_SECTIONS}
+        self.validate()
+
+    def validate(self):
+        if self.poll_interval < 0:
+            raise ValueError(f"[data] poll_interval must not be negative: {self.poll_interval}")
+        if self.temperature_unit not in TEMPERATURE_UNITS:
+            raise ValueError(f"[data] temperature_unit must be F or C: {self.temperature_unit}")
+        if self.queue_policy not in QUEUE_POLICIES:
+            raise ValueError(f"[data] queue_policy must be drop_oldest or overflow: {self.queue_policy}")
+        if self.queue_size < 1:
+            raise ValueError(f"[data] queue_size must be at least 1: {self.queue_size}")
+
+    # Sink section as {option: value} with typed values, enabled is always present
+    def __sink(self, config, section):
+        options = {'enabled': False}
+        if not config.has_section(section): return options
+        for key, value in config.items(section):
+            value = value.strip()
+            option_type = SINK_OPTION_TYPES.get(key)
+            if option_type is not None and value == '':
+                continue # unset, the sink's default applies
+            try:
+                if option_type is bool:
+                    value = config.getboolean(section, key)
+                elif option_type is not None:
+                    value = option_type(value)
+            except ValueError as e:
+                raise ValueError(f"[{section}] {key}: {e}")
+            options[key] = value
+        return options
+
+    # The configured fields of a reading, or the whole reading when fields is empty or any is missing
+    def project(self, data):
+        if self.fields and self.field_set.issubset(data):
+            return {key: data[key] for key in self.fields}
+        return data
+
+# Settings of config, or None with the error logged when it is invalid
+def load_settings(config):
+    try:
+        return Settings(config)
+    except ValueError as e:
+        logging.error(f"Invalid config: {e}")
+        return None
@@ -1,15 +1,31 @@
 import logging
 import time
 from .BaseClient import BaseClient
-from .Utils import bytes_to_int, format_temperature
+from .RegisterMap import Field, RegisterMap
+from .Utils import bytes_to_int
+from .WindowAggregator import WindowAggregator
 
 logger = logging.getLogger(__name__)
 SHUNT_READ_SUCCESS = 87
 
 # Shunt Client is purely notification-driven
 # rather than the controller-style Modbus read request flow.
+# Every notification is parsed and folded into a window of poll_interval seconds, each reading
+# carries the window's min/max/mean voltage and current and the Ah/Wh that flowed during it.
+
+SHUNT_INFO = RegisterMap(
+    Field('main_battery_percent', 34, scale=0.1, unit='%'),
+    Field('main_battery_voltage', 25, 3, scale=0.001, unit='V'),
+    Field('starter_battery_voltage', 30, scale=0.001, unit='V'),
+    Field('charge_amps', 21, 3, signed=True, scale=0.001, unit='A'),
+    Field('battery_temperature', 66, scale=0.1, unit='C')
+)
+AGGREGATED_FIELDS = ('main_battery_voltage', 'charge_amps')
+INTEGRATED_FIELDS = {'charge_ah': ('charge_amps', 1 / 3600), 'charge_wh': ('charge_watts', 1 / 3600)}
 
 class ShuntClient(BaseClient):
+    max_pipeline_window = 1 # notification driven, never sends requests
+
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
 
@@ -20,33 +36,32 @@ class ShuntClient(BaseClient):
         self.on_data_callback = on_data_callback
         self.on_error_callback = on_error_callback
         self.data = {}
-        self.throttle_timer_len = self.config['data'].getint('poll_interval')
-        self.throttle_timer = time.perf_counter() - self.throttle_timer_len - 1
+        self.window_start = None
+        self.aggregator = WindowAggregator(AGGREGATED_FIELDS, INTEGRATED_FIELDS)
 
     async def on_data_received(self, response):
-        logger.debug("ShuntClient.on_data_received")
         operation = bytes_to_int(response, 1, 1)
 
-        if (time.perf_counter() - self.throttle_timer) <= self.throttle_timer_len:
+        if operation != SHUNT_READ_SUCCESS:
+            logger.debug("Ignoring shunt notification with operation=%s", operation)
             return
 
-        self.throttle_timer = time.perf_counter()
+        now = time.monotonic()
+        reading = self.parse_shunt_info(response)
+        self.aggregator.add(now, reading)
 
-        if operation != SHUNT_READ_SUCCESS:
-            logger.debug("Ignoring shunt notification with operation=%s", operation)
+        # the first notification is reported right away, then one reading per window
+        if self.window_start is not None and now - self.window_start < self.settings.poll_interval:
             return
 
-        self.data = self.parse_shunt_info(response)
+        self.window_start = now
+        reading.update(self.aggregator.flush())
+        self.data = reading
         self.on_read_operation_complete()
+        self.cycle_started = now # the next reading covers the window starting now
 
     def parse_shunt_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['main_battery_percent'] = bytes_to_int(bs, 34, 2, scale=0.1)
-        data['main_battery_voltage'] = bytes_to_int(bs, 25, 3, scale=0.001)
-        data['starter_battery_voltage'] = bytes_to_int(bs, 30, 2, scale=0.001)
-        data['charge_amps'] = bytes_to_int(bs, 21, 3, scale=0.001, signed=True)
+        data = self.decode_section(SHUNT_INFO, bs, {})
         data['charge_watts'] = round((data['main_battery_voltage'] * data['charge_amps']), 2)
-        data['battery_temperature'] = format_temperature(bytes_to_int(bs, 66, 2, scale=0.1), temp_unit)
-        logger.debug("Shunt payload: %s", bs.hex())
+        if logger.isEnabledFor(logging.DEBUG): logger.debug("Shunt payload: %s", bs.hex())
         return data
@@ -0,0 +1,237 @@
+import asyncio
+import functools
+import logging
+import random
+from types import SimpleNamespace
+from .Capture import CONNECTED, DISCONNECTED, LOST, NOTIFY, RECORDER, WRITE
+from .Utils import crc16_modbus
+
+# Local stand-in for BLEManager that serves Modbus register maps of simulated Renogy devices.
+# Latency, dropped and fragmented notifications and disconnects can be injected, which makes it
+# possible to load test BaseClient, the parsers and the retry / pacing settings without a radio.
+# Each simulated link is a handful of asyncio callbacks, so hundreds of devices fit in one process.
+# The traffic is captured like a real device's when RECORDER is open.
+#
+#   simulator = Simulator(latency=0.05, fragment_rate=0.1)
+#   client = RoverClient(config, on_data, on_error)
+#   simulator.add_client(client)
+#   client.start()
+
+SHUNT_NOTIFY_INTERVAL = 1 # (seconds)
+ILLEGAL_DATA_ADDRESS = 2
+
+def text_registers(start, text, words):
+    bs = text.encode('utf-8').ljust(words * 2, b' ')
+    return {start + i: int.from_bytes(bs[i * 2:i * 2 + 2], 'big') for i in range(words)}
+
+def block_registers(start, words, values):
+    registers = {start + i: 0 for i in range(words)}
+    registers.update(values)
+    return registers
+
+def rover_registers(device_id=17):
+    registers = text_registers(12, 'RNG-CTRL-WND10', 8)
+    registers.update(block_registers(20, 7, {26: device_id}))
+    registers.update(block_registers(256, 34, {
+        256: 87, 257: 129, 258: 258, 259: (33 << 8) | 25, 260: 0, 261: 0, 262: 0,
+        263: 171, 264: 204, 265: 35, 271: 143, 272: 0, 273: 34, 274: 34, 275: 432, 276: 0,
+        277: 703, 284: 6, 285: 32822, 288: 2
+    }))
+    registers[57348] = 4
+    return registers
+
+def battery_registers(device_id=48):
+    registers = block_registers(5000, 34, {5000: 4, 5001: 33, 5002: 33, 5003: 33, 5004: 33, 5017: 4, 5018: 210, 5019: 210, 5020: 210, 5021: 210})
+    registers.update(block_registers(5042, 6, {5042: 140, 5043: 145, 5044: 1, 5045: 34405, 5046: 1, 5047: 34464}))
+    registers.update(text_registers(5122, 'RBT100LFP12S-G', 8))
+    registers[5223] = device_id
+    return registers
+
+def inverter_registers(device_id=32):
+    registers = block_registers(4000, 10, {4000: 1249, 4001: 220, 4002: 1249, 4003: 119, 4004: 5997, 4005: 144, 4006: 300, 4009: 5997})
+    registers[4109] = device_id
+    registers.update(text_registers(4311, 'RIV1230RCH-SPS', 8))
+    registers.update(block_registers(4327, 7, {4327: 100, 4328: 7, 4333: 10}))
+    registers.update(block_registers(4408, 6, {4408: 12, 4409: 108, 4410: 150, 4413: 5}))
+    return registers
+
+def dc_charger_registers(device_id=96):
+    registers = text_registers(12, 'RBC50D1S-G1', 8)
+    registers.update(block_registers(20, 7, {26: device_id}))
+    registers.update(block_registers(256, 30, {256: 100, 257: 132, 259: (18 << 8) | 25, 260: 129, 277: 703, 279: 1435, 281: 5607, 284: 1, 285: 11044}))
+    registers.update(block_registers(286, 5, {288: 6}))
+    registers[57348] = 4
+    return registers
+
+def shunt_notification(rng):
+    bs = bytearray(80)
+    bs[1] = 87
+    bs[21:24] = int(rng.uniform(-20000, 20000)).to_bytes(3, 'big', signed=True)
+    bs[25:28] = int(rng.uniform(12800, 13400)).to_bytes(3, 'big')
+    bs[30:32] = (12600).to_bytes(2, 'big')
+    bs[34:36] = (985).to_bytes(2, 'big')
+    bs[66:68] = (199).to_bytes(2, 'big')
+    return bs
+
+# device type => (register map factory, default slave id)
+DEVICE_PROFILES = {
+    'RNG_CTRL': (rover_registers, 17),
+    'RNG_BATT': (battery_registers, 48),
+    'RNG_INVT': (inverter_registers, 32),
+    'RNG_DCC': (dc_charger_registers, 96)
+}
+
+class SimulatedDevice:
+    def __init__(self, mac_addr, alias, slaves=None, notification=None):
+        self.mac_addr = mac_addr.upper()
+        self.alias = alias
+        self.slaves = slaves if slaves is not None else {} # slave id => {register: word}
+        self.notification = notification # callable(rng) returning a pushed notification (shunt)
+        self.requests = 0
+
+    # Modbus response to a raw request, None when the device stays silent
+    def respond(self, request):
+        if len(request) != 8 or crc16_modbus(request[:-2]) != request[-2:]:
+            return None
+        self.requests += 1
+        device_id, function = request[0], request[1]
+        register = int.from_bytes(request[2:4], 'big')
+        value = int.from_bytes(request[4:6], 'big')
+        if device_id == 255:
+            device_id = next(iter(self.slaves), None)
+        registers = self.slaves.get(device_id)
+        if registers is None:
+            return None
+
+        if function == 3:
+            try:
+                data = b''.join(registers[r].to_bytes(2, 'big') for r in range(register, register + value))
+                frame = bytes([device_id, function, value * 2]) + data
+            except KeyError:
+                frame = bytes([device_id, function | 0x80, ILLEGAL_DATA_ADDRESS])
+        elif function == 6:
+            registers[register] = value
+            frame = bytes([device_id]) + request[1:6]
+        else:
+            frame = bytes([device_id, function | 0x80, 1])
+        return frame + crc16_modbus(frame)
+
+class Simulator:
+    def __init__(self, latency=0.05, jitter=0, drop_rate=0, fragment_rate=0, disconnect_rate=0, connect_fail_rate=0,
+                 discovery_time=0, connect_time=0, notify_interval=SHUNT_NOTIFY_INTERVAL, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.fragment_rate = fragment_rate
+        self.disconnect_rate = disconnect_rate
+        self.connect_fail_rate = connect_fail_rate
+        self.discovery_time = discovery_time
+        self.connect_time = connect_time
+        self.notify_interval = notify_interval
+        self.random = random.Random(seed)
+        self.devices = {}
+
+    def add_device(self, device):
+        self.devices[device.mac_addr] = device
+        return device
+
+    # Registers a device matching the client's [device] section and routes the client to it
+    def add_client(self, client):
+        section = client.config['device']
+        if section['type'] == 'RNG_SHNT':
+            device = SimulatedDevice(section['mac_addr'], section['alias'], notification=shunt_notification)
+        elif section['type'] == 'RNG_HUB':
+            slaves = {slave.device_id: DEVICE_PROFILES[slave.config['device']['type']][0](slave.device_id) for slave in client.slaves}
+            device = SimulatedDevice(section['mac_addr'], section['alias'], slaves)
+        else:
+            factory, default_id = DEVICE_PROFILES[section['type']]
+            device_id = section.getint('device_id')
+            device_id = default_id if device_id == 255 else device_id
+            device = SimulatedDevice(section['mac_addr'], section['alias'], {device_id: factory(device_id)})
+        self.attach(client)
+        return self.add_device(device)
+
+    def attach(self, client):
+        client.ble_manager_class = functools.partial(SimulatedBLEManager, self)
+
+    def find(self, mac_address, alias):
+        device = self.devices.get(mac_address.upper())
+        if device is None:
+            device = next((d for d in self.devices.values() if d.alias == alias), None)
+        return device
+
+    def chance(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+class SimulatedBLEManager:
+    def __init__(self, simulator, mac_address, alias, on_data, on_connect_fail, on_disconnect, **kwargs):
+        self.simulator = simulator
+        self.mac_address = mac_address
+        self.device_alias = alias
+        self.data_callback = on_data
+        self.connect_fail_callback = on_connect_fail
+        self.disconnect_callback = on_disconnect
+        self.simulated_device = None
+        self.device = None
+        self.client = None
+        self.discovered_devices = []
+        self.notify_task = None
+
+    async def discover(self):
+        await asyncio.sleep(self.simulator.discovery_time)
+        self.simulated_device = self.simulator.find(self.mac_address, self.device_alias)
+        if self.simulated_device:
+            self.device = SimpleNamespace(name=self.simulated_device.alias, address=self.simulated_device.mac_addr)
+            self.discovered_devices = [self.device]
+
+    async def connect(self):
+        if not self.device: return logging.error("No device connected!")
+        await asyncio.sleep(self.simulator.connect_time)
+        if self.simulator.chance(self.simulator.connect_fail_rate):
+            return self.connect_fail_callback(ConnectionError("Simulated connection failure"))
+        self.client = SimpleNamespace(is_connected=True, address=self.device.address)
+        RECORDER.record(CONNECTED, self.device_alias, mac_addr=self.device.address)
+        if self.simulated_device.notification:
+            self.notify_task = asyncio.get_running_loop().create_task(self.__notify())
+
+    async def characteristic_write_value(self, data):
+        if not self.client or not self.client.is_connected:
+            return logging.info('characteristic_write_value failed: not connected')
+        RECORDER.record(WRITE, self.device_alias, data, self.device.address)
+        if self.simulator.chance(self.simulator.disconnect_rate):
+            return self.__drop_connection()
+        response = self.simulated_device.respond(bytes(data))
+        if response is None or self.simulator.chance(self.simulator.drop_rate):
+            return
+        delay = self.simulator.latency + self.simulator.random.uniform(0, self.simulator.jitter)
+        asyncio.get_running_loop().call_later(delay, self.__send, response)
+
+    async def disconnect(self):
+        if self.notify_task: self.notify_task.cancel()
+        if self.client and self.client.is_connected:
+            RECORDER.record(DISCONNECTED, self.device_alias, mac_addr=self.device.address)
+            self.client.is_connected = False
+
+    def __send(self, frame):
+        if not self.client or not self.client.is_connected: return
+        loop = asyncio.get_running_loop()
+        if self.simulator.chance(self.simulator.fragment_rate) and len(frame) > 2:
+            split = self.simulator.random.randint(1, len(frame) - 1)
+            fragments = [frame[:split], frame[split:]]
+        else:
+            fragments = [frame]
+        for fragment in fragments:
+            RECORDER.record(NOTIFY, self.device_alias, fragment, self.device.address)
+            loop.create_task(self.data_callback(bytearray(fragment)))
+
+    def __drop_connection(self):
+        logging.warning(f"Simulated disconnect from device: {self.mac_address}")
+        self.client.is_connected = False
+        RECORDER.record(LOST, self.device_alias, mac_addr=self.device.address)
+        if self.notify_task: self.notify_task.cancel()
+        self.disconnect_callback()
+
+    async def __notify(self):
+        while self.client.is_connected:
+            await asyncio.sleep(self.simulator.notify_interval)
+            self.__send(self.simulated_device.notification(self.simulator.random))
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Append-only on-disk queue holding readings that could not be delivered.
+# Records are written as <length, crc32> headers followed by the zlib compressed JSON reading,
+# into numbered segment files of at most segment_size bytes. A cursor file remembers the next
+# record to replay. When the spool grows beyond max_size the oldest segment is dropped.
+# Writes are flushed right away but only fsynced every fsync_interval seconds to spare SD cards.
+
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+SEGMENT_SIZE = 1024 * 1024 # (bytes)
+MAX_SIZE = 50 * 1024 * 1024 # (bytes)
+FSYNC_INTERVAL = 5 # (seconds)
+
+class Spool:
+    def __init__(self, path, max_size=MAX_SIZE, segment_size=SEGMENT_SIZE, fsync_interval=FSYNC_INTERVAL, decode=None):
+        self.path = path
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self.decode = decode # turns a stored list back into a reading, e.g. Reading._make
+        self.lock = threading.Lock()
+        self.writer = None
+        self.last_fsync = 0
+        os.makedirs(path, exist_ok=True)
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+        self.cursor = self.__load_cursor()
+
+    def append(self, readings):
+        with self.lock:
+            if self.writer is None or self.writer.tell() >= self.segment_size:
+                self.__roll()
+            for reading in readings:
+                payload = zlib.compress(json.dumps(list(reading)).encode('utf-8'))
+                self.writer.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.writer.flush()
+            if time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self.__fsync()
+            self.__evict()
+
+    # Reads up to max_records from the cursor, returns (readings, position after them)
+    def read(self, max_records):
+        with self.lock:
+            readings = []
+            segment, offset = self.cursor
+            while len(readings) < max_records and segment is not None:
+                with open(self.__segment_path(segment), 'rb') as f:
+                    f.seek(offset)
+                    while len(readings) < max_records:
+                        header = f.read(RECORD_HEADER.size)
+                        if len(header) < RECORD_HEADER.size: break
+                        length, crc = RECORD_HEADER.unpack(header)
+                        payload = f.read(length)
+                        if len(payload) < length or zlib.crc32(payload) != crc:
+                            logging.warning(f"Spool: skipping damaged record in segment {segment}")
+                            offset = os.path.getsize(self.__segment_path(segment))
+                            break
+                        reading = json.loads(zlib.decompress(payload))
+                        readings.append(self.decode(reading) if self.decode else reading)
+                        offset = f.tell()
+                next_segment = self.__next_segment(segment)
+                if len(readings) < max_records and next_segment is not None and offset >= os.path.getsize(self.__segment_path(segment)):
+                    segment, offset = next_segment, 0
+                else:
+                    break
+            return readings, (segment, offset)
+
+    # Marks everything before position as delivered and deletes finished segments
+    def commit(self, position):
+        with self.lock:
+            if position[0] not in self.segments: return # evicted while being replayed
+            self.cursor = position
+            for segment in [s for s in self.segments if s < position[0]]:
+                self.__remove(segment)
+            self.__save_cursor()
+
+    def empty(self):
+        with self.lock:
+            segment, offset = self.cursor
+            if segment is None: return True
+            return self.__next_segment(segment) is None and offset >= os.path.getsize(self.__segment_path(segment))
+
+    def size(self):
+        return sum(os.path.getsize(self.__segment_path(s)) for s in self.segments)
+
+    def close(self):
+        with self.lock:
+            if self.writer:
+                self.__fsync()
+                self.writer.close()
+                self.writer = None
+
+    def __roll(self):
+        if self.writer:
+            self.__fsync()
+            self.writer.close()
+        segment = self.segments[-1] + 1 if len(self.segments) > 0 else 1
+        self.segments.append(segment)
+        self.writer = open(self.__segment_path(segment), 'ab')
+        if self.cursor[0] is None:
+            self.cursor = (segment, 0)
+
+    def __fsync(self):
+        os.fsync(self.writer.fileno())
+        self.last_fsync = time.monotonic()
+
+    def __evict(self):
+        while len(self.segments) > 1 and self.size() > self.max_size:
+            segment = self.segments[0]
+            logging.warning(f"Spool: size limit reached, dropping oldest segment {segment}")
+            if self.cursor[0] == segment:
+                self.cursor = (self.segments[1], 0)
+                self.__save_cursor()
+            self.__remove(segment)
+
+    def __remove(self, segment):
+        self.segments.remove(segment)
+        os.remove(self.__segment_path(segment))
+
+    def __next_segment(self, segment):
+        later = [s for s in self.segments if s > segment]
+        return later[0] if len(later) > 0 else None
+
+    def __segment_path(self, segment):
+        return os.path.join(self.path, f'{segment:08d}{SEGMENT_SUFFIX}')
+
+    def __load_cursor(self):
+        try:
+            with open(os.path.join(self.path, CURSOR_FILE)) as f:
+                segment, offset = json.load(f)
+            if segment in self.segments: return (segment, offset)
+        except (OSError, ValueError):
+            pass
+        return (self.segments[0], 0) if len(self.segments) > 0 else (None, 0)
+
+    def __save_cursor(self):
+        tmp = os.path.join(self.path, CURSOR_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(list(self.cursor), f)
+        os.replace(tmp, os.path.join(self.path, CURSOR_FILE))
@@ -0,0 +1,95 @@
+import logging
+import sqlite3
+import threading
+import time
+
+# Local time-series store for readings, backed by SQLite in WAL mode.
+# Raw numeric samples are kept for retention_days, and every insert also updates
+# 1 minute, 1 hour and 1 day aggregates (count, sum, min, max) that are kept much longer.
+#
+#   store = TimeSeriesStore('renogy.db')
+#   store.samples('BT-TH-B00FXXXX', 'pv_power', start=time.time() - 3600)
+#   store.aggregate('BT-TH-B00FXXXX', 'pv_power', '1h', start=time.time() - 86400)
+
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400} # name => bucket size (seconds)
+ROLLUP_RETENTION = {'1m': 30 * 86400, '1h': 730 * 86400, '1d': None} # (seconds), None keeps forever
+RETENTION_DAYS = 7
+PRUNE_INTERVAL = 600 # (seconds)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (device TEXT NOT NULL, field TEXT NOT NULL, ts REAL NOT NULL, value REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS samples_series ON samples (device, field, ts);
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    device TEXT NOT NULL, field TEXT NOT NULL, resolution INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL,
+    PRIMARY KEY (device, field, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (device, field, resolution, bucket, count, sum, min, max) VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (device, field, resolution, bucket) DO UPDATE SET
+    count = count + 1, sum = sum + excluded.sum, min = min(min, excluded.min), max = max(max, excluded.max)
+"""
+
+class TimeSeriesStore:
+    def __init__(self, path, retention_days=RETENTION_DAYS):
+        self.retention = retention_days * 86400
+        self.lock = threading.Lock()
+        self.last_prune = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    # Stores the numeric fields of readings, each (timestamp, device, data), in one transaction
+    def insert(self, readings):
+        samples = []
+        for timestamp, device, data in readings:
+            for field, value in data.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and not field.startswith('__'):
+                    samples.append((device, field, timestamp, value))
+        rollups = [(device, field, seconds, int(ts // seconds) * seconds, value, value, value)
+                   for device, field, ts, value in samples for seconds in RESOLUTIONS.values()]
+
+        with self.lock, self.db:
+            self.db.executemany('INSERT INTO samples (device, field, ts, value) VALUES (?, ?, ?, ?)', samples)
+            self.db.executemany(UPSERT_ROLLUP, rollups)
+            if time.time() - self.last_prune >= PRUNE_INTERVAL:
+                self.__prune()
+
+    # Raw samples as [(timestamp, value)], oldest first
+    def samples(self, device, field, start=0, end=None):
+        with self.lock:
+            return self.db.execute('SELECT ts, value FROM samples WHERE device = ? AND field = ? AND ts >= ? AND ts < ? ORDER BY ts',
+                (device, field, start, end if end is not None else float('inf'))).fetchall()
+
+    # Aggregates as [(bucket start, count, mean, min, max)], oldest first
+    def aggregate(self, device, field, resolution='1h', start=0, end=None):
+        seconds = RESOLUTIONS[resolution]
+        with self.lock:
+            return self.db.execute('SELECT bucket, count, sum / count, min, max FROM rollups '
+                'WHERE device = ? AND field = ? AND resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket',
+                (device, field, seconds, int(start // seconds) * seconds, end if end is not None else float('inf'))).fetchall()
+
+    def devices(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute('SELECT DISTINCT device FROM rollups WHERE resolution = ?', (RESOLUTIONS['1d'],))]
+
+    def fields(self, device):
+        with self.lock:
+            return [row[0] for row in self.db.execute('SELECT DISTINCT field FROM rollups WHERE device = ? AND resolution = ?', (device, RESOLUTIONS['1d']))]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __prune(self):
+        now = time.time()
+        self.db.execute('DELETE FROM samples WHERE ts < ?', (now - self.retention,))
+        for resolution, retention in ROLLUP_RETENTION.items():
+            if retention is not None:
+                self.db.execute('DELETE FROM rollups WHERE resolution = ? AND bucket < ?', (RESOLUTIONS[resolution], now - retention))
+        self.last_prune = now
+        logging.debug("TimeSeriesStore: pruned old samples")
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# Timeline of the polling path written as Chrome trace events, one track per device.
+# Open the file in chrome://tracing or https://ui.perfetto.dev to see where a cycle spends
+# its time. Tracing is off until open() is called, spans are then a no-op.
+#
+#   TRACER.open('trace.json')
+#   with TRACER.span('discover', 'BT-TH-B00FXXXX'): ...
+
+class Tracer:
+    def __init__(self):
+        self.file = None
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.tracks = {} # device => track id
+
+    def open(self, path):
+        self.file = open(path, 'w')
+        self.file.write('[\n') # the closing bracket is optional in the trace event format
+        logging.info(f"Tracing poll cycles to {path}")
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    # Context manager recording the time spent in the block
+    def span(self, name, device, **args):
+        return Span(self, name, device, args) if self.file else NO_SPAN
+
+    # Records a span that started and ended in different callbacks, times from time.monotonic()
+    def complete(self, name, device, start, end, **args):
+        if self.file:
+            self.__write({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'tid': self.__track(device), 'args': args})
+
+    def instant(self, name, device, **args):
+        if self.file:
+            self.__write({'name': name, 'ph': 'i', 's': 't', 'ts': time.monotonic() * 1e6, 'tid': self.__track(device), 'args': args})
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def __track(self, device):
+        track = self.tracks.get(device)
+        if track is None:
+            track = self.tracks[device] = len(self.tracks) + 1
+            self.__write({'name': 'thread_name', 'ph': 'M', 'tid': track, 'args': {'name': device}})
+        return track
+
+    def __write(self, event):
+        event['pid'] = self.pid
+        with self.lock:
+            if self.file:
+                self.file.write(json.dumps(event) + ',\n')
+
+class Span:
+    def __init__(self, tracer, name, device, args):
+        self.tracer = tracer
+        self.name = name
+        self.device = device
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.device, self.start, time.monotonic(), **self.args)
+
+class NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NO_SPAN = NoSpan()
+TRACER = Tracer()
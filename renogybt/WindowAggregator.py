@@ -0,0 +1,48 @@
+# Streaming statistics over a window of samples, without keeping the samples.
+# Tracks min, max and mean of the given fields and integrates others over time with the
+# trapezoidal rule, e.g. amps into Ah. The last sample is carried into the next window so
+# no time is lost between windows, unless samples are more than max_gap seconds apart
+# (e.g. after a reconnect), in which case that interval is not integrated.
+
+MAX_GAP = 30 # (seconds)
+
+class WindowAggregator:
+    # fields: names to track min/max/mean of
+    # integrals: {output name: (field, scale)}, e.g. {'charge_ah': ('charge_amps', 1 / 3600)}
+    def __init__(self, fields, integrals=None, max_gap=MAX_GAP):
+        self.fields = fields
+        self.integrals = integrals or {}
+        self.max_gap = max_gap
+        self.last = None # (timestamp, values) of the previous sample
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.stats = {field: [float('inf'), float('-inf'), 0] for field in self.fields} # min, max, sum
+        self.totals = {name: 0 for name in self.integrals}
+
+    def add(self, timestamp, values):
+        self.count += 1
+        for field, stats in self.stats.items():
+            value = values[field]
+            if value < stats[0]: stats[0] = value
+            if value > stats[1]: stats[1] = value
+            stats[2] += value
+        if self.last is not None and 0 < timestamp - self.last[0] <= self.max_gap:
+            elapsed = timestamp - self.last[0]
+            for name, (field, scale) in self.integrals.items():
+                self.totals[name] += (self.last[1][field] + values[field]) / 2 * elapsed * scale
+        self.last = (timestamp, values)
+
+    # Returns the window statistics and starts a new window
+    def flush(self):
+        result = {'window_samples': self.count}
+        for field, (low, high, total) in self.stats.items():
+            if self.count == 0: continue
+            result[f'{field}_min'] = low
+            result[f'{field}_max'] = high
+            result[f'{field}_mean'] = round(total / self.count, 3)
+        for name, total in self.totals.items():
+            result[name] = round(total, 4)
+        self.reset()
+        return result
@@ -5,4 +5,11 @@ from .RoverHistoryClient import RoverHistoryClient
 from .InverterClient import InverterClient
 from .DCChargerClient import DCChargerClient
 from .ShuntClient import ShuntClient
+from .HubClient import HubClient
 from .Utils import *
+from .FleetRunner import FleetRunner
+from .Simulator import Simulator, SimulatedDevice
+from .Replay import Replay
+from .BatchDecoder import BatchDecoder
+from .ChangeFilter import ChangeFilter
+from .Settings import Settings
@@ -0,0 +1,50 @@
+import asyncio
+import configparser
+import logging
+import sys
+import time
+from renogybt import FleetRunner, Simulator
+
+# Polls simulated devices to measure poll-cycle throughput without a BLE radio
+# usage: python3 simulate.py [devices] [seconds] [latency]
+
+logging.basicConfig(level=logging.WARNING)
+
+device_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+device_types = ['RNG_CTRL', 'RNG_BATT', 'RNG_INVT', 'RNG_DCC', 'RNG_SHNT']
+
+config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+config.read_dict({'data': {'enable_polling': 'true', 'poll_interval': '0', 'temperature_unit': 'F', 'fields': ''}})
+for i in range(device_count):
+    config[f'device.{i}'] = {
+        'type': device_types[i % len(device_types)],
+        'mac_addr': f'00:00:00:00:{i // 256:02X}:{i % 256:02X}',
+        'alias': f'SIM-{i}',
+        'device_id': '255'
+    }
+
+readings = {}
+def on_data_received(client, data):
+    readings[data['__client']] = readings.get(data['__client'], 0) + 1
+
+def on_error(client, error):
+    logging.error(f"on_error: {error}")
+
+simulator = Simulator(latency=latency, jitter=latency / 2, notify_interval=latency * 4)
+fleet = FleetRunner(config, on_data_received, on_error)
+for client in fleet.clients:
+    simulator.add_client(client)
+
+async def main():
+    asyncio.get_running_loop().call_later(duration, lambda: [client.stop() for client in fleet.clients])
+    await fleet.run()
+
+started = time.perf_counter()
+asyncio.run(main())
+elapsed = time.perf_counter() - started
+requests = sum(device.requests for device in simulator.devices.values())
+print(f"{device_count} devices, {elapsed:.1f}s, {requests / elapsed:.0f} requests/s")
+for name, count in sorted(readings.items()):
+    print(f"  {name}: {count} readings, {count / elapsed:.1f}/s")
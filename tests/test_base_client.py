@@ -0,0 +1,159 @@
+import asyncio
+import configparser
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from renogybt.BatteryClient import BatteryClient
+from renogybt.RoverClient import RoverClient
+from renogybt.Utils import crc16_modbus
+
+
+def make_config(**device):
+    cfg = configparser.ConfigParser()
+    cfg.read_dict(
+        {
+            "device": {"device_id": "255", "alias": "BT-TH-TEST", "mac_addr": "AA:BB:CC:DD:EE:FF", **device},
+            "data": {"poll_interval": "60", "enable_polling": "false", "temperature_unit": "C"},
+        }
+    )
+    return cfg
+
+
+def read_response(words):
+    frame = bytes([255, 3, len(words) * 2]) + b"".join(w.to_bytes(2, "big") for w in words)
+    return frame + crc16_modbus(frame)
+
+
+def test_plan_reads_merges_adjacent_sections():
+    client = BatteryClient(make_config())
+
+    plan = client.plan_reads(client.sections)
+
+    assert [(r["register"], r["words"]) for r in plan] == [(5000, 34), (5042, 6), (5122, 8), (5223, 1)]
+    assert plan[2] is client.sections[3]
+
+
+@pytest.mark.parametrize("gap, expected", [("-1", 4), ("0", 4), ("5", 4), ("6", 3), ("300", 3)])
+def test_plan_reads_respects_gap_and_max_words(gap, expected):
+    client = RoverClient(make_config(read_gap=gap))
+
+    assert len(client.plan_reads(client.sections)) == expected
+
+
+def test_merged_response_is_sliced_back_to_each_parser():
+    callback = MagicMock()
+    client = BatteryClient(make_config(), on_data_callback=callback)
+    client.sections = client.sections[:2]
+    client.loop = MagicMock()
+    client.ble_manager = MagicMock()
+    client.ble_manager.characteristic_write_value = AsyncMock()
+    asyncio.run(client.read_section())
+
+    cells = [4] + [33, 34, 35, 36] + [0] * 12
+    temps = [2] + [215, 0xFFF6] + [0] * 14
+    asyncio.run(client.on_data_received(read_response(cells + temps)))
+
+    data = callback.call_args[0][1]
+    assert [data[f"cell_voltage_{i}"] for i in range(4)] == [3.3, 3.4, 3.5, 3.6]
+    assert (data["temperature_0"], data["temperature_1"]) == (21.5, -1.0)
+
+
+@pytest.mark.parametrize("window", ["1", "2"])
+def test_timed_out_merged_read_is_retried_as_separate_sections(window):
+    client = BatteryClient(make_config(pipeline_window=window))
+    client.sections = [client.sections[3]] + client.sections[:3] # the merged read is the second request
+    client.loop = MagicMock()
+    client.loop.is_running.return_value = False # no retry task, sent by hand below
+    client.ble_manager = MagicMock()
+    client.ble_manager.characteristic_write_value = AsyncMock()
+    asyncio.run(client.read_section())
+    client.section_index = 1
+    assert client.read_plan[1]["words"] == 34
+
+    client.on_read_timeout()
+    asyncio.run(client.read_section()) # what the retry sends after reconnecting
+
+    assert client.read_gap == -1
+    assert [(r["register"], r["words"]) for r in client.read_plan] == [(5122, 8), (5000, 17), (5017, 17), (5042, 6)]
+    request = client.ble_manager.characteristic_write_value.await_args_list[-int(window)][0][0]
+    assert request[2:6] == [0x13, 0x88, 0, 17]
+
+def test_adaptive_request_gap_grows_on_failure_and_decays_on_success():
+    client = BatteryClient(make_config(adaptive_gap="true"))
+    client.sections = client.sections[2:4]
+    client.loop = MagicMock()
+    client.ble_manager = MagicMock()
+    client.ble_manager.characteristic_write_value = AsyncMock()
+    asyncio.run(client.read_section())
+    assert client.request_gap == 0
+
+    error = bytes([255, 131, 2])
+    asyncio.run(client.on_data_received(error + crc16_modbus(error)))
+    assert client.request_gap == 0.05
+
+    client.section_index = 0
+    for _ in range(20):
+        asyncio.run(client.on_data_received(read_response([0] * 6)))
+        client.section_index = 0
+    assert client.request_gap == 0
+
+
+def test_fragmented_response_is_reassembled_before_parsing():
+    callback = MagicMock()
+    client = BatteryClient(make_config(), on_data_callback=callback)
+    client.sections = client.sections[4:]
+    client.loop = MagicMock()
+    client.ble_manager = MagicMock()
+    client.ble_manager.characteristic_write_value = AsyncMock()
+    asyncio.run(client.read_section())
+
+    response = read_response([48])
+    asyncio.run(client.on_data_received(bytearray(response[:4])))
+    callback.assert_not_called()
+    asyncio.run(client.on_data_received(bytearray(response[4:])))
+
+    assert callback.call_args[0][1]["device_id"] == 48
+
+
+def test_pipelined_responses_are_matched_by_length_and_window_is_capped():
+    client = BatteryClient(make_config(read_gap="-1", pipeline_window="10"))
+    assert client.pipeline_window == 4
+    assert RoverClient(make_config(pipeline_window="10")).pipeline_window == 2
+
+    client.loop = MagicMock()
+    client.ble_manager = MagicMock()
+    client.ble_manager.characteristic_write_value = AsyncMock()
+
+    async def run():
+        await client.read_section()
+        assert client.ble_manager.characteristic_write_value.await_count == 4
+        # a response of unexpected length is not credited to any request
+        await client.on_data_received(read_response([1, 2]))
+        assert len(client.in_flight) == 4
+        # the 6 word response answers the third request, freeing a slot for the fifth
+        await client.on_data_received(read_response([0, 145, 1, 34405, 1, 34464]))
+        assert [request["index"] for request in client.in_flight] == [0, 1, 3, 4]
+
+    asyncio.run(run())
+    assert client.data["voltage"] == 14.5
+
+
+def test_bad_crc_fails_the_pipelined_request_it_answers():
+    client = BatteryClient(make_config(read_gap="-1", pipeline_window="4"))
+    client.loop = MagicMock()
+    client.ble_manager = MagicMock()
+    client.ble_manager.characteristic_write_value = AsyncMock()
+    cell_temps = read_response([4] + [210] * 16)
+    corrupted = bytearray(read_response([0, 145, 1, 34405, 1, 34464]))
+    corrupted[4] ^= 0xFF
+
+    async def run():
+        await client.read_section()
+        # one good and one corrupted response in the same notification
+        await client.on_data_received(cell_temps + bytes(corrupted))
+
+    asyncio.run(run())
+    # the 17 word reads were sent first, the good one answered the first and the corrupted
+    # 6 word one failed the third request, not the oldest one still waiting
+    assert [request["index"] for request in client.in_flight] == [1, 3, 4]
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from renogybt import BLEManager as ble_module
+from renogybt.BLEManager import BLEManager, ScanCache
+
+
+class FakeScanner:
+    instances = 0
+
+    def __init__(self, detection_callback=None, **kwargs):
+        FakeScanner.instances += 1
+        self.detection_callback = detection_callback
+
+    async def __aenter__(self):
+        asyncio.get_running_loop().call_later(0.05, self.detection_callback, SimpleNamespace(address="11:22:33:44:55:66", name="OTHER"), None)
+        asyncio.get_running_loop().call_later(0.1, self.detection_callback, SimpleNamespace(address="AA:BB:CC:DD:EE:FF", name="BT-TH-TEST"), None)
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def make_manager(**kwargs):
+    return BLEManager("aa:bb:cc:dd:ee:ff", "BT-TH-TEST", None, None, None, "", "", "", **kwargs)
+
+
+def test_discover_returns_early_and_reuses_cached_scan():
+    FakeScanner.instances = 0
+
+    async def run():
+        with patch.object(ble_module, "SCAN_CACHE", ScanCache()), patch.object(ble_module, "BleakScanner", FakeScanner):
+            first = make_manager()
+            started = time.monotonic()
+            await first.discover()
+            elapsed = time.monotonic() - started
+
+            second = make_manager()
+            await second.discover()
+            return first, second, elapsed
+
+    first, second, elapsed = asyncio.run(run())
+
+    assert first.device.address == "AA:BB:CC:DD:EE:FF"
+    assert [d.name for d in first.discovered_devices] == ["OTHER", "BT-TH-TEST"]
+    assert elapsed < ble_module.DISCOVERY_TIMEOUT
+    assert second.device is first.device
+    assert FakeScanner.instances == 1
+
+
+def test_concurrent_discoveries_share_one_scanner():
+    FakeScanner.instances = 0
+
+    async def run():
+        with patch.object(ble_module, "SCAN_CACHE", ScanCache()), patch.object(ble_module, "BleakScanner", FakeScanner):
+            managers = [make_manager(scan_cache_ttl=0) for _ in range(5)]
+            await asyncio.gather(*[m.discover() for m in managers])
+            return managers
+
+    managers = asyncio.run(run())
+
+    assert all(m.device.address == "AA:BB:CC:DD:EE:FF" for m in managers)
+    assert FakeScanner.instances == 1
+
+
+def test_each_adapter_scans_with_its_own_scanner():
+    adapters = []
+
+    class AdapterScanner(FakeScanner):
+        def __init__(self, detection_callback=None, **kwargs):
+            super().__init__(detection_callback)
+            adapters.append(kwargs.get("bluez", {}).get("adapter"))
+
+    async def run():
+        with patch.object(ble_module, "SCAN_CACHE", ScanCache()), patch.object(ble_module, "SCAN_CACHES", {}), patch.object(ble_module, "BleakScanner", AdapterScanner):
+            managers = [make_manager(), make_manager(adapter="hci1"), make_manager(adapter="hci1")]
+            await asyncio.gather(*[m.discover() for m in managers])
+            return managers
+
+    managers = asyncio.run(run())
+
+    assert all(m.device.address == "AA:BB:CC:DD:EE:FF" for m in managers)
+    assert sorted(adapters, key=str) == [None, "hci1"]
+
+
+def test_discovery_while_the_scanner_stops_waits_for_a_new_scan():
+    active = []
+
+    class SlowStoppingScanner(FakeScanner):
+        async def __aenter__(self):
+            active.append(self)
+            assert len(active) == 1, "two scanners on one adapter"
+            return await super().__aenter__()
+
+        async def __aexit__(self, *args):
+            await asyncio.sleep(0.2)
+            active.remove(self)
+            return False
+
+    async def run():
+        cache = ScanCache()
+        matches = lambda device: device.name == "BT-TH-TEST"
+        with patch.object(ble_module, "BleakScanner", SlowStoppingScanner):
+            first = await cache.wait_for(matches, 1)
+            await asyncio.sleep(0.15)
+            late = await cache.wait_for(matches, 1) # the first scanner is still stopping
+        return first, late
+
+    FakeScanner.instances = 0
+    first, late = asyncio.run(run())
+
+    assert first.address == late.address == "AA:BB:CC:DD:EE:FF"
+    assert FakeScanner.instances == 2
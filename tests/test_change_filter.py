@@ -0,0 +1,18 @@
+from renogybt.ChangeFilter import ChangeFilter, parse_deadbands
+
+
+def test_parse_deadbands():
+    assert parse_deadbands("battery_voltage:0.1, pv_power:5%") == {"battery_voltage": (0.1, False), "pv_power": (5.0, True)}
+    assert parse_deadbands("") == {}
+
+
+def test_only_changes_outside_the_deadband_are_published():
+    change_filter = ChangeFilter(parse_deadbands("battery_voltage:0.1, pv_power:5%"), heartbeat=300)
+    reading = {"__device": "BT-TH-TEST", "model": "RNG-CTRL-RVR40", "battery_voltage": 13.0, "pv_power": 200, "load_status": "off"}
+
+    assert change_filter.filter("BT-TH-TEST", reading, now=0) == reading
+    assert change_filter.filter("BT-TH-TEST", dict(reading, battery_voltage=13.05, pv_power=209), now=10) is None
+    assert change_filter.filter("BT-TH-TEST", dict(reading, battery_voltage=13.1, pv_power=209), now=20) == {"__device": "BT-TH-TEST", "battery_voltage": 13.1}
+    # compared against the last published value, so slow drift is still reported
+    assert change_filter.filter("BT-TH-TEST", dict(reading, battery_voltage=13.1, pv_power=210, load_status="on"), now=30) == {"__device": "BT-TH-TEST", "pv_power": 210, "load_status": "on"}
+    assert change_filter.filter("BT-TH-TEST", dict(reading, battery_voltage=13.1, pv_power=210, load_status="on"), now=300) == dict(reading, battery_voltage=13.1, pv_power=210, load_status="on")
@@ -0,0 +1,254 @@
+import asyncio
+import configparser
+import threading
+import time
+from types import SimpleNamespace
+
+from renogybt.DataLogger import OVERFLOW, DataLogger, Reading, Sink
+
+
+def reading(n):
+    return Reading(time.time(), "BT-TH-TEST", "RNG_CTRL", {"n": n})
+
+
+def test_slow_sink_does_not_block_the_loop():
+    release = threading.Event()
+    delivered = []
+
+    def send(batch):
+        release.wait(5)
+        delivered.extend(r.data["n"] for r in batch)
+
+    async def run():
+        sink = Sink("slow", send)
+        sink.task = asyncio.get_running_loop().create_task(sink.run())
+        started = time.monotonic()
+        for n in range(3):
+            sink.put(reading(n))
+            await asyncio.sleep(0)
+        elapsed = time.monotonic() - started
+        release.set()
+        await asyncio.wait_for(sink.queue.join(), 5)
+        sink.task.cancel()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+    assert delivered == [0, 1, 2]
+
+
+def test_send_overrunning_the_timeout_is_not_spooled(tmp_path):
+    from renogybt.Spool import Spool
+
+    delivered = []
+
+    def send(batch):
+        time.sleep(0.2)
+        delivered.extend(r.data["n"] for r in batch)
+
+    async def run():
+        sink = Sink("slow", send, timeout=0.05, spool=Spool(str(tmp_path / "spool"), decode=Reading._make))
+        sink.task = asyncio.get_running_loop().create_task(sink.run())
+        sink.put(reading(0))
+        await asyncio.wait_for(sink.queue.join(), 5)
+        sink.task.cancel()
+        return sink.spool.empty()
+
+    assert asyncio.run(run())
+    assert delivered == [0]
+
+
+def test_http_sink_timeout_covers_every_retry():
+    from renogybt.DataLogger import HTTP_RETRIES, http_budget
+
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"data": {}, "remote_logging": {"enabled": "true", "timeout": "10"}, "mqtt": {"enabled": "true", "timeout": "10"}})
+    remote, mqtt = DataLogger(cfg).create_sinks()
+
+    assert remote.timeout == http_budget(10) >= (HTTP_RETRIES + 1) * 10
+    assert mqtt.timeout == 10
+
+
+def test_batches_by_size_and_drops_oldest_when_full():
+    batches = []
+
+    async def run():
+        sink = Sink("batched", lambda batch: batches.append([r.data["n"] for r in batch]), batch_size=3, batch_window=0.05, queue_size=4)
+        for n in range(6):
+            sink.put(reading(n))
+        sink.task = asyncio.get_running_loop().create_task(sink.run())
+        await asyncio.wait_for(sink.queue.join(), 5)
+        sink.task.cancel()
+        return sink.dropped
+
+    assert asyncio.run(run()) == 2
+    assert batches == [[2, 3, 4], [5]]
+
+
+def test_overflow_policy_holds_one_more_queue_and_close_waits_for_it():
+    delivered = []
+
+    async def run():
+        sink = Sink("overflowing", lambda batch: delivered.extend(r.data["n"] for r in batch), queue_size=2, policy=OVERFLOW)
+        for n in range(6):
+            sink.put(reading(n))
+        held = len(sink.overflow)
+        sink.task = asyncio.get_running_loop().create_task(sink.run())
+        await asyncio.wait_for(sink.queue.join(), 5)
+        sink.task.cancel()
+        return held, sink.dropped
+
+    assert asyncio.run(run()) == (2, 2)
+    assert delivered == [0, 1, 4, 5]
+
+
+def test_pvoutput_sink_only_accepts_controllers():
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({
+        "data": {},
+        "remote_logging": {"enabled": "false"},
+        "mqtt": {"enabled": "false"},
+        "pvoutput": {"enabled": "true"},
+    })
+    logger = DataLogger(cfg)
+    sent = []
+
+    async def run():
+        logger.sinks = logger.create_sinks()
+        logger.sinks[0].send = lambda batch: sent.extend(batch)
+        for sink in logger.sinks:
+            sink.task = asyncio.get_running_loop().create_task(sink.run())
+        for device_type in ["RNG_BATT", "RNG_CTRL"]:
+            client = SimpleNamespace(config={"device": {"alias": "X", "type": device_type}})
+            logger.submit(client, {"pv_power": 1})
+        await logger.close()
+
+    asyncio.run(run())
+    assert [r.device_type for r in sent] == ["RNG_CTRL"]
+
+
+def test_change_only_sends_deltas_to_mqtt_and_remote_logging_only():
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({
+        "data": {"change_only": "true"},
+        "remote_logging": {"enabled": "true"},
+        "mqtt": {"enabled": "true"},
+        "pvoutput": {"enabled": "true"},
+        "local_store": {"enabled": "false"},
+    })
+    logger = DataLogger(cfg)
+    sent = {}
+
+    async def run():
+        logger.sinks = logger.create_sinks()
+        for sink in logger.sinks:
+            sink.send = lambda batch, name=sink.name: sent.setdefault(name, []).extend(r.data for r in batch)
+            sink.task = asyncio.get_running_loop().create_task(sink.run())
+        client = SimpleNamespace(config={"device": {"alias": "X", "type": "RNG_CTRL"}})
+        for pv_power in [10, 10, 20]:
+            logger.submit(client, {"pv_power": pv_power, "battery_voltage": 13.0})
+        await logger.close()
+
+    asyncio.run(run())
+    full = [{"pv_power": p, "battery_voltage": 13.0} for p in [10, 10, 20]]
+    assert sent["pvoutput"] == full
+    assert sent["remote_logging"] == sent["mqtt"] == [full[0], {"pv_power": 20}]
+
+
+def pvoutput_logger(system_id):
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"data": {}, "pvoutput": {"enabled": "true", "api_key": "key", "system_id": system_id}})
+    logger = DataLogger(cfg)
+    posts = []
+    response = SimpleNamespace(status_code=200, text="", headers={})
+    logger.http = SimpleNamespace(post=lambda url, data, headers, timeout: posts.append((headers["X-Pvoutput-SystemId"], data["data"])) or response)
+    return logger, posts
+
+
+def controller_reading(timestamp, device, pv_power, generated):
+    return Reading(timestamp, device, "RNG_CTRL", {"pv_power": pv_power, "power_generation_today": generated})
+
+
+def test_pvoutput_averages_each_controller_into_its_own_system():
+    logger, posts = pvoutput_logger("CTRL-A:1, CTRL-B:2")
+    start = 1717236000 # on an interval boundary
+    logger.log_pvoutput_batch([controller_reading(start + n * 60, device, power, 1000 + n)
+        for n in range(2) for device, power in [("CTRL-A", 100), ("CTRL-B", 300)]])
+    for pvoutput in logger.pvoutputs.values():
+        pvoutput.close_interval()
+        pvoutput.next_request = 0
+    logger.flush_pvoutput()
+
+    assert sorted((system_id, data.split(",")[2:4]) for system_id, data in posts) == [("1", ["1001", "100.0"]), ("2", ["1001", "300.0"])]
+
+
+def test_pvoutput_single_system_takes_only_the_first_controller():
+    logger, posts = pvoutput_logger("1")
+    logger.log_pvoutput_batch([controller_reading(1717236000, "CTRL-A", 100, 1000), controller_reading(1717236000, "CTRL-B", 300, 5000)])
+    logger.pvoutputs["CTRL-A"].close_interval()
+    logger.flush_pvoutput()
+
+    assert logger.pvoutputs["CTRL-B"] is None
+    assert [data.split(",")[2:4] for _, data in posts] == [["1000", "100.0"]]
+
+
+def test_idle_sink_runs_its_timer_without_readings():
+    ticks = []
+
+    async def run():
+        sink = Sink("timer", lambda batch: None, idle=lambda: ticks.append(1), idle_interval=0.02)
+        sink.task = asyncio.get_running_loop().create_task(sink.run())
+        await asyncio.sleep(0.15)
+        sink.task.cancel()
+
+    asyncio.run(run())
+    assert len(ticks) >= 3
+
+
+def test_mqtt_reuses_one_connection_per_device():
+    from unittest.mock import MagicMock, patch
+    import paho.mqtt.client as mqtt
+
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"mqtt": {"server": "localhost", "port": "1883", "topic": "solar/state", "user": "", "password": "", "qos": "1"}})
+    logger = DataLogger(cfg)
+    clients = []
+
+    def make_client(*args, **kwargs):
+        client = MagicMock()
+        client.client_id = kwargs["client_id"]
+        client.connect_async.side_effect = lambda *a: client.on_connect(client, None, None, 0, None)
+        client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+        clients.append(client)
+        return client
+
+    with patch.object(mqtt, "Client", side_effect=make_client):
+        for _ in range(3):
+            logger.log_mqtt({"pv_power": 1}, "BT-TH-A")
+        logger.log_mqtt({"pv_power": 2}, "BT-TH-B")
+        logger.close_mqtt()
+
+    assert [c.client_id for c in clients] == ["renogy-bt-BT-TH-A", "renogy-bt-BT-TH-B"]
+    assert clients[0].publish.call_count == 3
+    assert clients[0].publish.call_args.kwargs["qos"] == 1
+    assert all(c.loop_stop.called for c in clients)
+
+
+def test_remote_batch_is_posted_as_gzip_json_array():
+    import gzip
+    import json
+    from unittest.mock import MagicMock
+
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"remote_logging": {"url": "https://example.com/post.php", "auth_header": "123", "batch_size": "10"}})
+    logger = DataLogger(cfg)
+    session = logger.http_session()
+    session.post = MagicMock(return_value=MagicMock(status_code=200))
+
+    logger.log_remote_batch([{"n": 1}, {"n": 2}])
+    logger.log_remote_batch([{"n": 3}])
+
+    first, second = session.post.call_args_list
+    assert first.kwargs["headers"]["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(first.kwargs["data"])) == [{"n": 1}, {"n": 2}]
+    assert json.loads(gzip.decompress(second.kwargs["data"])) == [{"n": 3}]
+    assert logger.http_session() is session
@@ -0,0 +1,116 @@
+import asyncio
+import configparser
+
+from renogybt import Simulator
+from renogybt.FleetRunner import FleetRunner, device_config, device_sections
+from renogybt.ShuntClient import ShuntClient
+from renogybt.BatteryClient import BatteryClient
+
+
+def make_config():
+    cfg = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    cfg.read_dict(
+        {
+            "device": {"device_id": "255", "alias": "RTMShunt300TEST", "mac_addr": "AA:BB:CC:DD:EE:01", "type": "RNG_SHNT"},
+            "device.battery": {"device_id": "48", "alias": "BT-TH-TEST", "mac_addr": "AA:BB:CC:DD:EE:02", "type": "RNG_BATT"},
+            "device.unknown": {"device_id": "1", "alias": "FOO", "mac_addr": "AA:BB:CC:DD:EE:03", "type": "FOO"},
+            "data": {"poll_interval": "60", "enable_polling": "false", "temperature_unit": "F"},
+        }
+    )
+    return cfg
+
+
+def test_device_config_exposes_section_as_device():
+    cfg = make_config()
+    assert device_sections(cfg) == ["device", "device.battery", "device.unknown"]
+
+    device_cfg = device_config(cfg, "device.battery")
+
+    assert device_cfg["device"]["alias"] == "BT-TH-TEST"
+    assert device_cfg["device"].getint("device_id") == 48
+    assert device_cfg["data"]["temperature_unit"] == "F"
+    assert not device_cfg.has_section("device.battery")
+
+
+def test_fleet_builds_one_client_per_known_device():
+    fleet = FleetRunner(make_config())
+
+    assert [type(c) for c in fleet.clients] == [ShuntClient, BatteryClient]
+    assert fleet.clients[1].device_id == 48
+
+
+def test_failing_device_does_not_stall_others():
+    fleet = FleetRunner(make_config())
+    finished = []
+
+    async def fail():
+        raise RuntimeError("adapter gone")
+
+    async def succeed():
+        await asyncio.sleep(0)
+        finished.append("battery")
+
+    fleet.clients[0].run = fail
+    fleet.clients[1].run = succeed
+
+    asyncio.run(fleet.run())
+
+    assert finished == ["battery"]
+
+
+def test_auto_adapters_are_spread_across_the_least_busy():
+    cfg = make_config()
+    cfg["bluetooth"] = {"adapters": "hci0, hci1"}
+    cfg["device"]["adapter"] = "hci0"
+    cfg["device.battery"]["adapter"] = "auto"
+    cfg["device.battery2"] = dict(cfg["device.battery"], alias="BT-TH-TEST2", mac_addr="AA:BB:CC:DD:EE:04")
+
+    fleet = FleetRunner(cfg)
+
+    assert [c.adapter for c in fleet.clients] == ["hci0", "hci1", "hci0"]
+
+
+def test_connects_per_adapter_are_capped_while_all_devices_poll(monkeypatch):
+    from renogybt.Simulator import SimulatedBLEManager
+
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"data": {"enable_polling": "true", "poll_interval": "0"}, "bluetooth": {"max_connections": "2"}})
+    for i in range(6):
+        cfg[f"device.{i}"] = {"type": "RNG_BATT", "mac_addr": f"00:00:00:00:00:{i:02X}", "alias": f"SIM-{i}", "device_id": "255"}
+    connecting = []
+    peak = []
+    connect = SimulatedBLEManager.connect
+
+    async def counted_connect(self):
+        connecting.append(self)
+        peak.append(len(connecting))
+        try:
+            await connect(self)
+        finally:
+            connecting.remove(self)
+
+    monkeypatch.setattr(SimulatedBLEManager, "connect", counted_connect)
+    readings = {}
+
+    def on_data(client, data):
+        readings[data["__device"]] = readings.get(data["__device"], 0) + 1
+        if all(readings.get(f"SIM-{i}", 0) >= 2 for i in range(6)):
+            for c in fleet.clients: c.stop()
+
+    fleet = FleetRunner(cfg, on_data)
+    simulator = Simulator(latency=0.001, connect_time=0.02)
+    for client in fleet.clients:
+        simulator.add_client(client)
+    asyncio.run(asyncio.wait_for(fleet.run(), 10))
+
+    assert sorted(readings) == [f"SIM-{i}" for i in range(6)]
+    assert max(peak) == 2
+
+
+def test_no_connect_cap_without_max_connections():
+    fleet = FleetRunner(make_config())
+    fleet.clients[0].run = fleet.clients[1].run = lambda: asyncio.sleep(0)
+
+    asyncio.run(fleet.run())
+
+    assert all(c.connection_slot is None for c in fleet.clients)
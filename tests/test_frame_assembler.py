@@ -0,0 +1,54 @@
+from renogybt.FrameAssembler import FrameAssembler
+from renogybt.Utils import crc16_modbus
+
+
+def frame(payload):
+    return payload + crc16_modbus(payload)
+
+
+READ = frame(bytes([255, 3, 4, 0, 1, 0, 2]))
+ERROR = frame(bytes([255, 131, 2]))
+WRITE = frame(bytes([255, 6, 1, 10, 0, 1]))
+
+
+def test_whole_frame_is_returned_without_copy():
+    assembler = FrameAssembler()
+    data = bytearray(READ)
+
+    frames = assembler.feed(data)
+
+    assert len(frames) == 1
+    assert isinstance(frames[0], memoryview)
+    assert frames[0].obj is data
+
+
+def test_fragments_are_joined():
+    assembler = FrameAssembler()
+
+    assert assembler.feed(READ[:2]) == []
+    assert assembler.feed(READ[2:6]) == []
+    frames = assembler.feed(READ[6:])
+
+    assert [bytes(f) for f in frames] == [READ]
+    assert len(assembler.buffer) == 0
+
+
+def test_coalesced_frames_are_split():
+    assembler = FrameAssembler()
+
+    frames = assembler.feed(READ + ERROR + WRITE + READ[:3])
+
+    assert [bytes(f) for f in frames] == [READ, ERROR, WRITE]
+    assert bytes(assembler.buffer) == READ[:3]
+
+
+def test_bad_crc_is_dropped_and_counted():
+    assembler = FrameAssembler()
+    corrupted = bytearray(READ)
+    corrupted[4] ^= 0xFF
+
+    frames = assembler.feed(bytes(corrupted) + ERROR)
+
+    assert [bytes(f) for f in frames] == [ERROR]
+    assert assembler.crc_errors == 1
+    assert assembler.rejected == [bytes(corrupted)]
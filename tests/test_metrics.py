@@ -0,0 +1,39 @@
+import urllib.request
+
+from renogybt.Metrics import Registry
+
+
+def test_render_counters_and_histograms():
+    registry = Registry()
+    reads = registry.counter("reads_total", "Reads")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    reads.inc(device='BT-"1"')
+    reads.inc(2, device='BT-"1"')
+    latency.observe(0.05, device="A")
+    latency.observe(0.5, device="A")
+    latency.observe(5, device="A")
+
+    assert registry.render().splitlines() == [
+        "# HELP reads_total Reads",
+        "# TYPE reads_total counter",
+        'reads_total{device="BT-\\"1\\""} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{device="A",le="0.1"} 1',
+        'latency_seconds_bucket{device="A",le="1"} 2',
+        'latency_seconds_bucket{device="A",le="+Inf"} 3',
+        'latency_seconds_sum{device="A"} 5.55',
+        'latency_seconds_count{device="A"} 3',
+    ]
+
+
+def test_serves_metrics_endpoint():
+    registry = Registry()
+    registry.counter("reads_total", "Reads").inc()
+    server = registry.serve(0, host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert response.status == 200
+            assert "reads_total 1" in response.read().decode()
+    finally:
+        registry.close()
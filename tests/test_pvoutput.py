@@ -0,0 +1,65 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from renogybt.PVOutput import PVOutput
+
+
+class FakeSession:
+    def __init__(self, remaining=59):
+        self.posts = []
+        self.remaining = remaining
+
+    def post(self, url, data, headers, timeout):
+        self.posts.append(data["data"])
+        self.remaining -= 1
+        return SimpleNamespace(status_code=200, text="", headers={
+            "X-Rate-Limit-Remaining": str(self.remaining), "X-Rate-Limit-Limit": "60", "X-Rate-Limit-Reset": "2000000000"})
+
+
+def controller(pv_power, generated):
+    return {"pv_power": pv_power, "power_generation_today": generated, "battery_voltage": 13.0, "load_power": 0}
+
+
+def test_readings_are_averaged_per_interval_and_sent_in_one_batch():
+    start = datetime(2024, 6, 1, 10, 0).timestamp()
+    session = FakeSession()
+    pvoutput = PVOutput("key", "1", session)
+    for minute in range(0, 15):
+        pvoutput.add(start + minute * 60, controller(100 + minute * 10, 1000 + minute))
+    pvoutput.close_interval()
+    pvoutput.flush(now=start + 900)
+
+    assert session.posts == ["20240601,10:04,1004,120.0,-1,0.0,-1,13.0;20240601,10:09,1009,170.0,-1,0.0,-1,13.0;20240601,10:14,1014,220.0,-1,0.0,-1,13.0"]
+    assert len(pvoutput.backlog) == 0
+
+
+def test_backlog_is_held_while_rate_limited():
+    start = datetime(2024, 6, 1, 10, 0).timestamp()
+    session = FakeSession(remaining=1)
+    pvoutput = PVOutput("key", "1", session, batch_size=2)
+    for n in range(5):
+        pvoutput.add(start + n * 300, controller(100, 1000))
+    pvoutput.close_interval()
+
+    pvoutput.flush(now=start)
+    pvoutput.flush(now=start + 30) # too soon after the last request
+    pvoutput.flush(now=start + 120) # quota used up until the reset time
+    assert len(session.posts) == 1
+    assert len(pvoutput.backlog) == 3
+
+    pvoutput.flush(now=2000000001)
+    assert len(session.posts) == 2
+    assert len(pvoutput.backlog) == 1
+
+
+def test_statuses_stay_on_their_day_across_midnight():
+    start = datetime(2024, 6, 1, 23, 55).timestamp()
+    session = FakeSession()
+    pvoutput = PVOutput("key", "1", session)
+    for minute in range(0, 7):
+        generated = 5000 + minute if minute < 5 else minute # today's total resets at midnight
+        pvoutput.add(start + minute * 60, controller(0, generated))
+    pvoutput.close_interval() # one-shot run closing the open interval
+    pvoutput.flush(now=start + 420)
+
+    assert session.posts == ["20240601,23:59,5004,0.0,-1,0.0,-1,13.0;20240602,00:01,6,0.0,-1,0.0,-1,13.0"]
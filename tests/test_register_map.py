@@ -0,0 +1,45 @@
+import pytest
+
+from renogybt.RegisterMap import Field, RegisterMap, SIGN_MAGNITUDE
+
+STATE = {0: "off", 1: "on"}
+
+EXAMPLE = RegisterMap(
+    Field("voltage", 5, scale=0.1, unit="V"),
+    Field("current", 3, signed=True, scale=0.01, unit="A"),
+    Field("temperature", 7, 1, signed=SIGN_MAGNITUDE, unit="C"),
+    Field("load", 8, 1, shift=7, enum=STATE),
+    Field("energy", 9, 3, signed=True),
+    Field("model", 12, 6, text=True),
+)
+
+
+def frame(*chunks):
+    return bytes([255, 3, 0]) + b"".join(chunks)
+
+
+def test_decode_applies_scale_sign_enum_and_unit():
+    bs = frame(b"\xFF\x38", b"\x00\x81", b"\x8A", b"\x80", b"\xFF\xFF\xFE", b"RBT\x00\x00\x00")
+
+    data = EXAMPLE.compile("C").decode(bs)
+
+    assert list(data) == ["voltage", "current", "temperature", "load", "energy", "model"]
+    assert data == {"voltage": 12.9, "current": -2.0, "temperature": -10, "load": "on", "energy": -2, "model": "RBT"}
+    assert EXAMPLE.compile("F").decode(bs)["temperature"] == 14.0
+
+
+def test_repeated_fields_are_trimmed_to_count():
+    cells = RegisterMap(Field("cell_count", 3), Field("cell_voltage", 5, scale=0.1, count=4, count_field="cell_count"))
+
+    data = cells.compile().decode(frame(b"\x00\x02", b"\x00\x21\x00\x22\x00\x23\x00\x24"))
+
+    assert data == {"cell_count": 2, "cell_voltage_0": 3.3, "cell_voltage_1": 3.4}
+
+
+def test_short_frame_decodes_missing_fields_as_zero():
+    assert EXAMPLE.compile("C").decode(frame(b"\x00\x64"))["voltage"] == 0
+
+
+def test_overlapping_fields_are_rejected():
+    with pytest.raises(ValueError):
+        RegisterMap(Field("a", 3, 4), Field("b", 5)).compile()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from renogybt import FleetRunner, Replay, Simulator
+from renogybt.Capture import CONNECTED, DISCONNECTED, NOTIFY, RECORDER, WRITE, read_capture
+
+from test_simulator import make_config, run_fleet
+
+
+def replay_fleet(cfg, replay):
+    readings = []
+
+    def on_data(client, data):
+        readings.append(dict(data))
+        client.stop()
+
+    fleet = FleetRunner(cfg, on_data)
+    for client in fleet.clients:
+        replay.attach(client)
+    asyncio.run(fleet.run())
+    return readings
+
+
+def strip_timestamps(reading):
+    return {k: v for k, v in reading.items() if not k.startswith("__read")}
+
+
+def test_capture_records_requests_and_notifications(tmp_path):
+    path = tmp_path / "renogy.cap"
+    RECORDER.open(path)
+    try:
+        run_fleet(make_config(2, "RNG_BATT"), Simulator(latency=0.01, fragment_rate=0.5, seed=1))
+    finally:
+        RECORDER.close()
+
+    tracks = read_capture(path)
+
+    assert sorted(tracks) == ["SIM-0", "SIM-1"]
+    events = tracks["SIM-0"].events
+    assert tracks["SIM-0"].mac_addr == "00:00:00:00:00:00"
+    assert events[0].kind == CONNECTED and events[-1].kind == DISCONNECTED
+    assert events[1].kind == WRITE and events[1].data[:2] == bytes([255, 3])
+    assert any(e.kind == NOTIFY for e in events)
+    assert [e.time for e in events] == sorted(e.time for e in events)
+
+
+def test_replay_reproduces_the_recorded_readings(tmp_path):
+    path = tmp_path / "renogy.cap"
+    RECORDER.open(path)
+    try:
+        recorded = run_fleet(make_config(1), Simulator(latency=0.05, fragment_rate=0.5, seed=2))
+    finally:
+        RECORDER.close()
+
+    started = time.monotonic()
+    timed = replay_fleet(make_config(1), Replay(path))
+    timed_elapsed = time.monotonic() - started
+    started = time.monotonic()
+    fast = replay_fleet(make_config(1), Replay(path, speed=0))
+    fast_elapsed = time.monotonic() - started
+
+    assert [strip_timestamps(r) for r in timed] == [strip_timestamps(r) for r in recorded]
+    assert [strip_timestamps(r) for r in fast] == [strip_timestamps(r) for r in recorded]
+    assert timed_elapsed >= 0.15 # 4 requests of 50ms
+    assert fast_elapsed < timed_elapsed
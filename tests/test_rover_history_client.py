@@ -0,0 +1,84 @@
+import configparser
+from datetime import date, timedelta
+
+from renogybt.RoverHistoryClient import RoverHistoryClient
+
+
+def make_client(tmp_path, history_days="30"):
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({
+        "device": {"device_id": "255", "alias": "BT-TH-TEST", "mac_addr": "AA:BB:CC:DD:EE:FF",
+                   "history_days": history_days, "history_cursor": str(tmp_path / "history.json")},
+        "data": {"temperature_unit": "C"},
+    })
+    return RoverHistoryClient(cfg)
+
+
+def day_record(generation):
+    bs = bytearray(25)
+    bs[19:21] = generation.to_bytes(2, "big")
+    return bs
+
+
+# runs one sync cycle, returning the registers read, days in failed are not parsed
+def sync(client, working_days, failed=()):
+    client.read_plan = client.plan_reads(client.sections)
+    client.parse_working_days(bytes([17, 3, 2]) + working_days.to_bytes(2, "big"))
+    registers = []
+    for index in range(1, len(client.read_plan)):
+        client.section_index = index
+        registers.append(client.read_plan[index]["register"])
+        if registers[-1] - 61440 in failed: continue
+        client.read_plan[index]["parser"](day_record(registers[-1] - 61440))
+    client.on_read_operation_complete()
+    return registers
+
+
+def test_reads_every_working_day_oldest_first_with_dates(tmp_path):
+    client = make_client(tmp_path, history_days="4")
+    readings = []
+    client.on_data_callback = lambda client, data: readings.append(dict(data))
+
+    assert sync(client, working_days=100) == [61443, 61442, 61441, 61440]
+    today = date.today()
+    assert readings[0]["daily_date"] == [(today - timedelta(days=n)).isoformat() for n in [3, 2, 1, 0]]
+    assert readings[0]["daily_power_generation"] == [3, 2, 1, 0]
+    assert readings[0]["total_working_days"] == 100
+
+
+def test_later_syncs_only_read_new_days(tmp_path):
+    client = make_client(tmp_path)
+    assert len(sync(client, working_days=5)) == 5
+    # yesterday was synced, only today is read again
+    assert sync(make_client(tmp_path), working_days=6) == [61440]
+
+
+def test_failed_day_is_read_again(tmp_path):
+    client = make_client(tmp_path)
+    assert sync(client, working_days=5, failed=[2]) == [61444, 61443, 61442, 61441, 61440]
+    # 4 and 3 days ago are synced, the failed day and everything after it are read again
+    assert sync(make_client(tmp_path), working_days=5) == [61442, 61441, 61440]
+    assert sync(make_client(tmp_path), working_days=5) == [61440]
+
+
+def test_failed_working_days_read_reports_empty_history(tmp_path):
+    import asyncio
+    from renogybt import Simulator, SimulatedDevice
+
+    client = make_client(tmp_path)
+    client.config["data"].update({"enable_polling": "true", "poll_interval": "0"})
+    client.settings.enable_polling, client.settings.poll_interval = True, 0
+    readings = []
+
+    def on_data(client, data):
+        readings.append(dict(data))
+        if len(readings) == 2: client.stop()
+
+    client.on_data_callback = on_data
+    simulator = Simulator(latency=0)
+    simulator.add_device(SimulatedDevice("AA:BB:CC:DD:EE:FF", "BT-TH-TEST", {17: {}})) # every read is an error response
+    simulator.attach(client)
+    asyncio.run(asyncio.wait_for(client.run(), 5))
+
+    assert [r["daily_date"] for r in readings] == [[], []]
+    assert not (tmp_path / "history.json").exists()
@@ -0,0 +1,79 @@
+import asyncio
+import configparser
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from renogybt import DataLogger, FleetRunner, Simulator
+from renogybt.Settings import Settings, load_settings
+
+from test_simulator import make_config
+
+
+def test_settings_are_typed_and_validated():
+    cfg = configparser.ConfigParser(inline_comment_prefixes=("#",))
+    cfg.read_dict({
+        "data": {"enable_polling": "true", "poll_interval": "30", "temperature_unit": " c ", "fields": "pv_power, battery_voltage"},
+        "mqtt": {"enabled": "true", "port": "1883", "qos": "1", "topic": "solar/state", "batch_size": ""},
+    })
+
+    settings = Settings(cfg)
+
+    assert settings.enable_polling and settings.poll_interval == 30 and settings.temperature_unit == "C"
+    assert settings.sinks["mqtt"] == {"enabled": True, "port": 1883, "qos": 1, "topic": "solar/state"}
+    assert settings.sinks["pvoutput"] == {"enabled": False}
+    assert settings.project({"pv_power": 1, "battery_voltage": 2, "load_power": 3}) == {"pv_power": 1, "battery_voltage": 2}
+    assert settings.project({"pv_power": 1}) == {"pv_power": 1}
+
+    cfg["data"]["temperature_unit"] = "K"
+    with pytest.raises(ValueError):
+        Settings(cfg)
+    cfg["data"]["temperature_unit"] = "F"
+    cfg["mqtt"]["qos"] = "high"
+    assert load_settings(cfg) is None
+
+
+def test_reload_applies_without_reconnecting():
+    cfg = make_config(1)
+    cfg["data"].update({"enable_polling": "true", "poll_interval": "0"})
+    readings = []
+
+    def on_data(client, data):
+        readings.append(dict(data))
+        if len(readings) == 1:
+            reloaded = make_config(1)
+            reloaded["data"].update({"enable_polling": "true", "poll_interval": "0", "temperature_unit": "F"})
+            fleet.reload(Settings(reloaded))
+        elif len(readings) == 2:
+            client.stop()
+
+    fleet = FleetRunner(cfg, on_data)
+    Simulator(latency=0).add_client(fleet.clients[0])
+    asyncio.run(fleet.run())
+
+    assert [r["controller_temperature"] for r in readings] == [33, 91.4]
+    assert fleet.clients[0].connections == 1
+
+
+def test_data_logger_reload_starts_and_reconfigures_sinks():
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"data": {}, "remote_logging": {"enabled": "false", "url": "https://example.com/post.php"}})
+    logger = DataLogger(cfg)
+    session = logger.http_session()
+    session.post = MagicMock(return_value=MagicMock(status_code=200))
+    client = SimpleNamespace(config={"device": {"alias": "X", "type": "RNG_CTRL"}})
+
+    async def run():
+        logger.submit(client, {"n": 1})
+        cfg["remote_logging"].update({"enabled": "true", "batch_size": "2", "batch_window": "5"})
+        logger.reload(Settings(cfg))
+        logger.submit(client, {"n": 2})
+        logger.submit(client, {"n": 3})
+        await logger.close()
+
+    asyncio.run(run())
+
+    assert [sink.name for sink in logger.sinks] == ["remote_logging"]
+    assert logger.sinks[0].batch_size == 2
+    assert session.post.call_count == 1
@@ -1,4 +1,5 @@
 import configparser
+from types import SimpleNamespace
 import pytest
 
 from renogybt.ShuntClient import ShuntClient
@@ -56,3 +57,39 @@ def test_on_data_received_triggers_callback_for_successful_notification(config):
 
     assert len(callback_calls) == 1
     assert callback_calls[0][1]["charge_amps"] == 1.0
+
+
+def test_every_notification_is_aggregated_into_the_window(config, monkeypatch):
+    import asyncio
+    import sys
+
+    shunt_module = sys.modules["renogybt.ShuntClient"]
+
+    readings = []
+    client = ShuntClient(config, on_data_callback=lambda client, data: readings.append(data))
+    clock = iter([0, 10, 20, 30, 60])
+    monkeypatch.setattr(shunt_module, "time", SimpleNamespace(monotonic=lambda: next(clock)))
+
+    async def notify(milliamps):
+        payload = bytearray(80)
+        payload[1] = 87
+        payload[21:24] = milliamps.to_bytes(3, "big", signed=True)
+        payload[25:28] = (12000).to_bytes(3, "big")
+        await client.on_data_received(payload)
+
+    async def run():
+        for milliamps in [1000, 2000, 4000, -1000, 1000]:
+            await notify(milliamps)
+
+    asyncio.run(run())
+
+    assert len(readings) == 2
+    assert readings[0]["window_samples"] == 1 and readings[0]["charge_ah"] == 0
+    window = readings[1]
+    assert window["window_samples"] == 4
+    assert window["charge_amps"] == 1.0
+    assert window["charge_amps_min"] == -1.0 and window["charge_amps_max"] == 4.0
+    assert window["charge_amps_mean"] == 1.5
+    # trapezoids: 15 + 30 + 15 + 0 amp-seconds
+    assert window["charge_ah"] == round(60 / 3600, 4)
+    assert window["charge_wh"] == round(60 * 12 / 3600, 4)
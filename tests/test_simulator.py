@@ -0,0 +1,183 @@
+import asyncio
+import configparser
+
+from renogybt import FleetRunner, Simulator
+
+
+def make_config(device_count, device_type="RNG_CTRL"):
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"data": {"enable_polling": "false", "poll_interval": "60", "temperature_unit": "C"}})
+    for i in range(device_count):
+        cfg[f"device.{i}"] = {"type": device_type, "mac_addr": f"00:00:00:00:00:{i:02X}", "alias": f"SIM-{i}", "device_id": "255"}
+    return cfg
+
+
+def run_fleet(cfg, simulator):
+    readings = []
+
+    def on_data(client, data):
+        readings.append(dict(data))
+        client.stop()
+
+    fleet = FleetRunner(cfg, on_data)
+    for client in fleet.clients:
+        simulator.add_client(client)
+    asyncio.run(fleet.run())
+    return readings
+
+
+def test_rover_reading_through_simulator():
+    readings = run_fleet(make_config(1), Simulator(latency=0))
+
+    assert readings[0]["model"] == "RNG-CTRL-WND10"
+    assert readings[0]["device_id"] == 17
+    assert readings[0]["battery_voltage"] == 12.9
+    assert readings[0]["controller_temperature"] == 33
+    assert readings[0]["power_generation_total"] == 426038
+    assert readings[0]["charging_status"] == "mppt"
+    assert readings[0]["battery_type"] == "lithium"
+
+
+def test_hundreds_of_devices_with_fragmented_notifications():
+    readings = run_fleet(make_config(200, "RNG_BATT"), Simulator(latency=0.01, jitter=0.01, fragment_rate=0.5, seed=1))
+
+    assert len(readings) == 200
+    assert {r["__device"] for r in readings} == {f"SIM-{i}" for i in range(200)}
+    assert all(r["cell_voltage_3"] == 3.3 and r["remaining_charge"] == 99.94 for r in readings)
+
+
+def test_simulated_disconnect_triggers_retry():
+    cfg = make_config(1)
+    simulator = Simulator(latency=0, disconnect_rate=1, seed=1)
+
+    fleet = FleetRunner(cfg)
+    client = fleet.clients[0]
+    simulator.add_client(client)
+    retries = []
+    client._BaseClient__handle_retry_async = lambda reason: retries.append(reason) or asyncio.sleep(0)
+
+    async def run():
+        task = asyncio.ensure_future(client.run())
+        for _ in range(10):
+            await asyncio.sleep(0)
+        client.stop()
+        await task
+
+    asyncio.run(run())
+
+    assert retries == ["Unexpected disconnect"]
+
+
+def test_hub_reads_every_slave_over_one_connection():
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({
+        "data": {"enable_polling": "false", "poll_interval": "60", "temperature_unit": "C"},
+        "device": {"type": "RNG_HUB", "mac_addr": "00:00:00:00:00:01", "alias": "SIM-HUB", "read_gap": "32",
+                   "slaves": "48:RNG_BATT, 49:RNG_BATT, 97:RNG_CTRL"},
+    })
+    simulator = Simulator(latency=0)
+    readings = run_fleet(cfg, simulator)
+
+    assert [(r["__device"], r["__client"], r["device_id"]) for r in readings] == [
+        ("SIM-HUB-48", "BatteryClient", 48), ("SIM-HUB-49", "BatteryClient", 49), ("SIM-HUB-97", "RoverClient", 97)]
+    assert readings[0]["cell_voltage_3"] == 3.3
+    assert readings[2]["battery_voltage"] == 12.9
+    assert len(simulator.devices) == 1
+
+
+def test_hub_stops_once_and_without_slaves_at_all():
+    from renogybt.Simulator import SimulatedBLEManager
+
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({
+        "data": {"enable_polling": "false", "poll_interval": "60", "temperature_unit": "C"},
+        "device.hub": {"type": "RNG_HUB", "mac_addr": "00:00:00:00:00:01", "alias": "SIM-HUB", "slaves": "48:RNG_BATT, 49:RNG_BATT"},
+        "device.empty": {"type": "RNG_HUB", "mac_addr": "00:00:00:00:00:02", "alias": "SIM-EMPTY", "slaves": "48:RNG_NONE"},
+    })
+    disconnects = []
+    original = SimulatedBLEManager.disconnect
+
+    async def disconnect(self):
+        disconnects.append(self.device_alias)
+        await original(self)
+
+    readings = []
+
+    def on_data(client, data):
+        readings.append(dict(data))
+        client.stop() # each slave stops the hub
+
+    fleet = FleetRunner(cfg, on_data)
+    simulator = Simulator(latency=0)
+    for client in fleet.clients:
+        simulator.add_client(client)
+    SimulatedBLEManager.disconnect = disconnect
+    try:
+        asyncio.run(asyncio.wait_for(fleet.run(), 5)) # the hub without slaves ends too
+    finally:
+        SimulatedBLEManager.disconnect = original
+
+    assert [r["__device"] for r in readings] == ["SIM-HUB-48", "SIM-HUB-49"]
+    assert disconnects == ["SIM-HUB"]
+
+
+def test_pipelined_requests_read_the_same_data_with_requests_in_flight(tmp_path):
+    from renogybt.Capture import NOTIFY, RECORDER, WRITE, read_capture
+    from renogybt.FrameAssembler import FrameAssembler
+
+    # the reading, and the most requests written before their responses came back
+    def captured_reading(window):
+        cfg = make_config(1, "RNG_BATT")
+        cfg["device.0"].update({"read_gap": "-1", "pipeline_window": window})
+        path = tmp_path / f"window-{window}.cap"
+        RECORDER.open(path)
+        try:
+            readings = run_fleet(cfg, Simulator(latency=0.01, fragment_rate=0.3, seed=1))
+        finally:
+            RECORDER.close()
+        assembler, in_flight, most_in_flight = FrameAssembler(), 0, 0
+        for event in read_capture(path)["SIM-0"].events:
+            if event.kind == WRITE:
+                in_flight += 1
+                most_in_flight = max(most_in_flight, in_flight)
+            elif event.kind == NOTIFY:
+                in_flight -= len(assembler.feed(event.data))
+        return readings[0], most_in_flight
+
+    serial, serial_in_flight = captured_reading("1")
+    pipelined, pipelined_in_flight = captured_reading("4")
+
+    timestamps = ("__read_started", "__read_completed")
+    assert {k: v for k, v in pipelined.items() if k not in timestamps} == {k: v for k, v in serial.items() if k not in timestamps}
+    assert serial_in_flight == 1
+    assert 1 < pipelined_in_flight <= 4
+
+
+def test_polling_is_instrumented():
+    from renogybt.Metrics import READINGS, REQUEST_SECONDS
+
+    cfg = make_config(1)
+    cfg["device.0"]["alias"] = "SIM-METRICS"
+    run_fleet(cfg, Simulator(latency=0))
+
+    assert READINGS.value(device="SIM-METRICS") == 1
+    assert REQUEST_SECONDS.count(device="SIM-METRICS", register=256) == 1
+
+
+def test_static_sections_are_read_once_per_connection():
+    cfg = make_config(1)
+    cfg["data"].update({"enable_polling": "true", "poll_interval": "0"})
+    simulator = Simulator(latency=0)
+    readings = []
+
+    def on_data(client, data):
+        readings.append(dict(data))
+        if len(readings) == 3:
+            client.stop()
+
+    fleet = FleetRunner(cfg, on_data)
+    simulator.add_client(fleet.clients[0])
+    asyncio.run(fleet.run())
+
+    assert simulator.devices["00:00:00:00:00:00"].requests == 4 + 1 + 1
+    assert all(r["model"] == "RNG-CTRL-WND10" and r["battery_type"] == "lithium" and r["battery_voltage"] == 12.9 for r in readings)
@@ -0,0 +1,71 @@
+import asyncio
+import sys
+import time
+
+from renogybt.DataLogger import Reading, Sink
+from renogybt.Spool import Spool
+
+
+def reading(n):
+    return Reading(1700000000 + n, "BT-TH-TEST", "RNG_CTRL", {"n": n})
+
+
+def test_readings_replay_in_order_across_segments_and_restarts(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=200, decode=Reading._make)
+    spool.append([reading(n) for n in range(5)])
+    spool.append([reading(n) for n in range(5, 10)])
+
+    batch, position = spool.read(4)
+    assert [r.data["n"] for r in batch] == [0, 1, 2, 3]
+    spool.commit(position)
+    spool.close()
+
+    reopened = Spool(str(tmp_path), segment_size=200, decode=Reading._make)
+    batch, position = reopened.read(100)
+    assert [r.data["n"] for r in batch] == [4, 5, 6, 7, 8, 9]
+    assert batch[0] == reading(4)
+    reopened.commit(position)
+    assert reopened.empty()
+
+
+def test_oldest_segments_are_evicted_past_max_size(tmp_path):
+    spool = Spool(str(tmp_path), segment_size=100, max_size=300)
+    for n in range(40):
+        spool.append([reading(n)])
+
+    assert spool.size() <= 300 + 100
+    batch, _ = spool.read(100)
+    assert batch[0][3]["n"] > 0
+    assert batch[-1][3]["n"] == 39
+
+
+def test_sink_spools_failed_batches_and_drains_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys.modules["renogybt.DataLogger"], "SPOOL_RETRY_INTERVAL", 0.05)
+    delivered = []
+    online = {"up": False}
+
+    def send(batch):
+        if not online["up"]:
+            raise ConnectionError("offline")
+        delivered.extend(r.data["n"] for r in batch)
+
+    async def run():
+        sink = Sink("remote", send, batch_size=2, spool=Spool(str(tmp_path), decode=Reading._make))
+        sink.task = asyncio.get_running_loop().create_task(sink.run())
+        for n in range(3):
+            sink.put(reading(n))
+            await sink.queue.join()
+        online["up"] = True  # drained by the retry timer, then the next reading goes out directly
+        started = time.monotonic()
+        while len(delivered) < 3 and time.monotonic() - started < 5:
+            await asyncio.sleep(0.01)
+        sink.put(reading(3))
+        await sink.queue.join()
+        started = time.monotonic()
+        while len(delivered) < 4 and time.monotonic() - started < 5:
+            await asyncio.sleep(0.01)
+        sink.task.cancel()
+        return sink.spool.empty()
+
+    assert asyncio.run(run())
+    assert delivered == [0, 1, 2, 3]
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+
+from renogybt.TimeSeriesStore import TimeSeriesStore
+
+
+def test_samples_and_rollups(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "renogy.db"))
+    hour = int(time.time() // 3600) * 3600
+    store.insert([
+        (hour + 10, "BT-TH-TEST", {"pv_power": 100, "model": "RNG-CTRL-RVR40", "load_status": True}),
+        (hour + 20, "BT-TH-TEST", {"pv_power": 300}),
+        (hour + 70, "BT-TH-TEST", {"pv_power": 200}),
+        (hour + 30, "BT-TH-OTHER", {"pv_power": 999}),
+    ])
+
+    assert store.samples("BT-TH-TEST", "pv_power") == [(hour + 10, 100), (hour + 20, 300), (hour + 70, 200)]
+    assert store.samples("BT-TH-TEST", "pv_power", start=hour + 15, end=hour + 70) == [(hour + 20, 300)]
+    assert store.aggregate("BT-TH-TEST", "pv_power", "1m") == [(hour, 2, 200, 100, 300), (hour + 60, 1, 200, 200, 200)]
+    assert store.aggregate("BT-TH-TEST", "pv_power", "1h") == [(hour, 3, 200, 100, 300)]
+    assert store.fields("BT-TH-TEST") == ["pv_power"]
+    assert sorted(store.devices()) == ["BT-TH-OTHER", "BT-TH-TEST"]
+
+
+def test_old_samples_are_pruned_but_aggregates_kept(tmp_path):
+    path = str(tmp_path / "renogy.db")
+    store = TimeSeriesStore(path, retention_days=1)
+    old = time.time() - 2 * 86400
+    store.insert([(old, "BT-TH-TEST", {"battery_voltage": 13.2})])
+    store.last_prune = 0
+    store.insert([(time.time(), "BT-TH-TEST", {"battery_voltage": 13.4})])
+
+    assert [value for _, value in store.samples("BT-TH-TEST", "battery_voltage")] == [13.4]
+    assert len(store.aggregate("BT-TH-TEST", "battery_voltage", "1h")) == 2
+    store.close()
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0] == "wal"
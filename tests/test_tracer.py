@@ -0,0 +1,25 @@
+import json
+
+from renogybt import Simulator
+from renogybt.Tracer import TRACER
+
+from test_simulator import make_config, run_fleet
+
+
+def test_poll_cycle_is_traced(tmp_path):
+    path = tmp_path / "trace.json"
+    TRACER.open(str(path))
+    try:
+        readings = run_fleet(make_config(1), Simulator(latency=0.01))
+    finally:
+        TRACER.close()
+
+    events = json.loads(path.read_text().rstrip().rstrip(",") + "]")
+    names = [event["name"] for event in events]
+    assert names[0] == "thread_name" and events[0]["args"]["name"] == "SIM-0"
+    assert names.count("request") == 4
+    assert names.count("parse") == 4
+    assert {"cycle", "callback"} <= set(names)
+    cycle = next(event for event in events if event["name"] == "cycle")
+    assert cycle["dur"] >= 4 * 0.01 * 1e6
+    assert readings[0]["__read_completed"] - readings[0]["__read_started"] >= 0.04